@@ -5,3 +5,4 @@ import stitch.core.stitch_lut
 import stitch.core.stitch_parser
 import stitch.core.stitch_interpreter
 import stitch.core.stitch_string
+import stitch.core.stitch_index
@@ -8,7 +8,9 @@ import pandas as pd
 from pandas import DataFrame, Series
 import numpy as np
 from stitch.core.utils import *
+from stitch.core.errors import *
 from stitch.core.stitch_interpreter import StitchInterpreter
+from stitch.core.stitch_index import INDEXES
 # ------------------------------------------------------------------------------
 
 '''The stitch_frame module contains the StitchFrame class
@@ -37,6 +39,7 @@ class StitchFrame(Base):
 
     Attributes:
         data (DataFrame): Internal DataFrame where data is actually stored
+        indexes (dict): Secondary index types keyed by column name
 
     Example:
         >>> data = [[ 'joe',  12, 'mechanic'],
@@ -73,11 +76,102 @@ class StitchFrame(Base):
             StitchFrame
         '''
         self._interpreter = StitchInterpreter()
+        self._indexes = OrderedDict()
+        self._built_indexes = (None, {})
 
         if type(data) is DataFrame:
             self._data = data
         else:
             self._data = DataFrame(data=data, index=index, columns=columns, dtype=dtype, copy=copy)
+
+    @property
+    def _data(self):
+        return self._dataframe
+
+    @_data.setter
+    def _data(self, data):
+        # replacing the internal DataFrame invalidates all secondary indexes
+        self._dataframe = data
+        self._built_indexes = (data, {})
+    # --------------------------------------------------------------------------
+
+    # indexes
+    @property
+    def indexes(self):
+        return dict(self._indexes)
+
+    def create_index(self, column, kind='hash'):
+        '''Create a secondary index on a column, used automatically by search
+
+        Indexes are rebuilt on the next search whenever the internal DataFrame
+        is replaced or the contents of their column change, including edits
+        made in place.
+
+        Args:
+            column (column name): Column to be indexed
+            kind (str, optional): Type of index. Default: hash
+                hash: equality queries (=, !=)
+                sorted: equality and range queries (<, <=, >, >=) on numeric columns
+
+        Returns:
+            StitchFrame
+
+        Example:
+            >>> sf.create_index('status')
+            >>> sf.create_index('pri', kind='sorted')
+            >>> sf.search('(status) = (failed) & (pri) <= (2500)')
+        '''
+        if kind not in INDEXES:
+            raise BadArgument('Improper index kind supplied. Should be hash or sorted. Value provided: ' + str(kind))
+        if column not in self._data.columns:
+            raise NotFound('Column not found: ' + str(column))
+        if kind == 'sorted' and not pd.api.types.is_numeric_dtype(self._data[column].dtype):
+            raise BadArgument('Sorted indexes require a numeric column: ' + str(column))
+
+        self._indexes[column] = kind
+        self._built_indexes[1].pop(column, None)
+        return self
+
+    def drop_index(self, column):
+        '''Drop the secondary index of a column'''
+        self._indexes.pop(column, None)
+        self._built_indexes[1].pop(column, None)
+        return self
+
+    def update_indexes(self):
+        '''Rebuild all secondary indexes from the internal DataFrame
+
+        Returns:
+            dict of built StitchIndexes keyed by column name
+        '''
+        data = self._data
+        self._built_indexes = (data, {})
+        return self._get_indexes(data)
+
+    def _get_indexes(self, data):
+        # indexes are cached together with the DataFrame they were built from,
+        # so that a concurrent patch never pairs them with other data
+        indexed, built = self._built_indexes
+        if indexed is not data:
+            built = {}
+
+        # build stale indexes, skipping columns that can no longer be indexed
+        for column, kind in self._indexes.items():
+            if column not in data.columns or not data.columns.is_unique:
+                built.pop(column, None)
+                continue
+            try:
+                # columns may have been edited in place
+                if column in built and built[column].is_current(data[column]):
+                    continue
+                built[column] = INDEXES[kind](data[column])
+            except TypeError:
+                built.pop(column, None)
+                continue
+
+        if data is self._data:
+            self._built_indexes = (data, built)
+        return built
     # --------------------------------------------------------------------------
 
     def applymap(self, func, columns=[], errors=False):
@@ -258,6 +352,50 @@ class StitchFrame(Base):
         func = lambda x: _coerce_nulls(x)
         return self.applymap(func, columns, errors)
 
+    def compact(self, columns=[], categorical_ratio=0.5, inplace=False):
+        '''Converts object columns into compact, typed columns
+
+        Numeric columns become int or float columns, with nulls as NaN.  Low
+        cardinality string columns become categoricals.
+
+        Args:
+            columns (list, optional): Columns to be compacted. Default: all columns.
+            categorical_ratio (float, optional): Maximum ratio of distinct values
+                to rows for a string column to be stored as a categorical.
+                Default: 0.5
+            inplace (bool, optional): Replace internal data with the compacted
+                data, otherwise return it as a new StitchFrame. Default: False
+
+        Returns:
+            StitchFrame
+
+        Example:
+            >>> print(sf.data.dtypes)
+            name      object
+            age       object
+            status    object
+
+            >>> print(sf.compact(inplace=True).data.dtypes)
+            name        object
+            age        float64
+            status    category
+        '''
+        if isinstance(columns, str):
+            columns = [columns]
+        if len(columns) == 0:
+            columns = self._data.columns
+
+        # columns are replaced on a copy, so other holders of the data are unaffected
+        data = self._data.copy()
+        for column in columns:
+            data[column] = compact_series(data[column], categorical_ratio)
+
+        if not inplace:
+            return StitchFrame(data)
+
+        self._data = data
+        return self
+
     def as_snakecase(self, columns=[], errors=False):
         if isinstance(columns, str):
             columns = [columns]
@@ -577,6 +715,9 @@ class StitchFrame(Base):
             iterables = iterables.dropna(how='all', axis=1)
             columns = iterables.columns.tolist()
 
+        if len(columns) == 0:
+            return self
+
         # Get right-hand flattened columns
         flatdata = _flatten(flatdata, columns)
 
@@ -812,6 +953,85 @@ class StitchFrame(Base):
         index.insert(level, item)
         self._data.index = index
         return self
+
+    def patch(self, data, key, removed=[]):
+        '''Updates, appends and removes rows by key, leaving all other rows untouched
+
+        Rows of data whose key matches an existing row replace that row
+        entirely, columns missing from data becoming NaN, the rest are
+        appended.  Existing rows keep their index labels and dtypes.
+
+        Args:
+            data (DataFrame): Changed and added rows.
+            key (list): Columns which uniquely identify a row.
+            removed (list, optional): Keys of rows to be removed, as tuples of
+                key column values. Default: []
+
+        Returns:
+            StitchFrame
+
+        Example:
+            >>> print(sf.data)
+               id  status
+            0   1  queued
+            1   2  queued
+
+            >>> new = DataFrame([[2, 'running'], [3, 'queued']], columns=['id', 'status'])
+            >>> print(sf.patch(new, 'id').data)
+               id   status
+            0   1   queued
+            1   2  running
+            2   3   queued
+        '''
+        if isinstance(key, str):
+            key = [key]
+
+        # copy on write, so the current data can still be safely read elsewhere
+        current = self._data.copy()
+        index = pd.MultiIndex.from_arrays([current[k].values for k in key])
+        if len(removed) > 0:
+            removed = [tuple(x) if is_listlike(x) else (x,) for x in removed]
+            mask = index.isin(removed)
+            current = current.drop(current.index[mask])
+            index = index[~mask]
+
+        for column in data.columns:
+            if column not in current.columns:
+                dtype = object if data[column].dtype == object else float
+                current[column] = Series(np.nan, index=current.index, dtype=dtype)
+            elif pd.api.types.is_categorical_dtype(current[column].dtype):
+                categories = current[column].cat.categories
+                new = pd.unique(data[column].dropna().values)
+                new = [x for x in new if x not in categories]
+                if new:
+                    current[column] = current[column].cat.add_categories(new)
+
+        # replace every column of existing rows
+        found = index.get_indexer(pd.MultiIndex.from_arrays([data[k].values for k in key]))
+        exists = found >= 0
+        labels = current.index[found[exists]]
+        data = data.reindex(columns=current.columns)
+        if len(labels) > 0:
+            for column in data.columns:
+                values = data[column]
+                if pd.api.types.is_categorical_dtype(values.dtype):
+                    values = values.astype(object)
+                current.loc[labels, column] = values.values[exists]
+
+        # append new rows, matching existing dtypes
+        new = data[~exists].reindex(columns=current.columns)
+        if len(new) > 0:
+            if pd.api.types.is_integer_dtype(current.index.dtype):
+                start = current.index.max() + 1 if len(current) > 0 else 0
+                new.index = range(start, start + len(new))
+            for column in current.columns:
+                if pd.api.types.is_categorical_dtype(current[column].dtype):
+                    categories = current[column].cat.categories
+                    new[column] = pd.Categorical(new[column], categories=categories)
+            current = pd.concat([current, new])
+
+        self._data = current
+        return self
     # --------------------------------------------------------------------------
 
     # simulation
@@ -1159,12 +1379,14 @@ class StitchFrame(Base):
     # --------------------------------------------------------------------------
 
     # search
-    def search(self, string, field_operator='=='):
+    def search(self, string, field_operator='==', inplace=True):
         '''Query data using the Stitch Query Language (stitchql)
 
         Args:
             string (str): stitchql search string
             field_operator (str): Advanced feature, do not use.  Default: '=='
+            inplace (bool, optional): Replace internal data with the results,
+                otherwise return them as a new StitchFrame. Default: True
 
         Returns:
             Queried (likely reduced) DataFrame
@@ -1246,8 +1468,13 @@ class StitchFrame(Base):
             single result.  Both operands are executed as independent queries and
             their results are then merged together with duplicate rows removed.
         '''
-        self._interpreter.search(string)
-        data = self._interpreter.dataframe_query(self._data, field_operator=field_operator)
+        # read once, so that data and its indexes belong to the same frame
+        data = self._data
+        data = self._interpreter.query(data, string, field_operator=field_operator,
+            indexes=self._get_indexes(data))
+
+        if not inplace:
+            return StitchFrame(data)
 
         self._data = data
         return self
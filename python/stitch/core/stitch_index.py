@@ -0,0 +1,165 @@
+from __future__ import with_statement, print_function, absolute_import
+from itertools import *
+from functools import *
+from numbers import Number
+import numpy
+from pandas.api.types import is_numeric_dtype
+from pandas.util import hash_pandas_object
+from stitch.core.utils import Base, as_iterable
+# ------------------------------------------------------------------------------
+
+'''
+.. module:: stitch_index
+	:platform: Unix
+	:synopsis: Secondary column indexes for stitchql queries
+
+.. moduleauthor:: Alex Braun <alexander.g.braun@gmail.com>
+'''
+
+class StitchIndex(Base):
+	'''
+	Base class for secondary indexes on a single DataFrame column
+
+	Indexes map column values to row positions.  They are only valid for the
+	Series they were built from, which is checked by comparing content versions.
+
+	Attributes:
+		kind (str): Type of index.
+		operators (list): stitchql operators supported by the index.
+	'''
+	kind = None
+	operators = []
+
+	def __init__(self, series):
+		'''StitchIndex initializer
+
+		Args:
+			series (Series): Column to be indexed.
+		'''
+		self._size = len(series)
+		self._version = get_version(series)
+		self.build(series)
+
+	def is_current(self, series):
+		'''Determine if index was built from a Series with the same contents'''
+		return get_version(series) == self._version
+
+	def build(self, series):
+		raise NotImplementedError('Please define this method in your subclass')
+
+	def supports(self, operator, values):
+		'''Determine if index can answer given stitchql query'''
+		return operator in self.operators
+
+	def _positions(self, operator, value):
+		raise NotImplementedError('Please define this method in your subclass')
+
+	def lookup(self, operator, values):
+		'''
+		Perform a boolean operation between the indexed column and a given set of values
+
+		Equivalent to vector_test on the indexed column.
+
+		Args:
+			operator (str): stitchql operator.
+			values (list): Values to test against.
+
+		Returns:
+			Boolean ndarray, or None if the query is not supported.
+		'''
+		if not self.supports(operator, values):
+			return None
+
+		mask = numpy.zeros(self._size, dtype=bool)
+		for value in as_iterable(values):
+			if operator == '!=':
+				# nulls are never equal to anything
+				temp = numpy.ones(self._size, dtype=bool)
+				temp[self._positions('==', value)] = False
+				mask |= temp
+			else:
+				mask[self._positions(operator, value)] = True
+		return mask
+
+class HashIndex(StitchIndex):
+	'''Index for equality queries, maps each distinct value to its row positions'''
+	kind = 'hash'
+	operators = ['==', '!=']
+
+	def build(self, series):
+		self._groups = series.groupby(series.values, sort=False).indices
+
+	def _positions(self, operator, value):
+		try:
+			return self._groups.get(value, [])
+		except TypeError:
+			# unhashable value
+			return []
+
+class SortedIndex(StitchIndex):
+	'''Index for range and equality queries on numeric columns'''
+	kind = 'sorted'
+	operators = ['==', '!=', '<', '<=', '>', '>=']
+
+	def build(self, series):
+		if not is_numeric_dtype(series.dtype):
+			raise TypeError('Sorted indexes require a numeric column')
+		values = series.values
+		positions = numpy.flatnonzero(~numpy.isnan(values.astype(float)))
+		order = numpy.argsort(values[positions], kind='mergesort')
+		self._order = positions[order]
+		self._values = values[self._order]
+
+	def supports(self, operator, values):
+		if operator not in self.operators:
+			return False
+		for value in as_iterable(values):
+			if not isinstance(value, Number) or isinstance(value, bool):
+				return False
+		return True
+
+	def _positions(self, operator, value):
+		values = self._values
+		if operator == '==':
+			start = numpy.searchsorted(values, value, side='left')
+			stop = numpy.searchsorted(values, value, side='right')
+			return self._order[start:stop]
+		if operator == '<':
+			return self._order[:numpy.searchsorted(values, value, side='left')]
+		if operator == '<=':
+			return self._order[:numpy.searchsorted(values, value, side='right')]
+		if operator == '>':
+			return self._order[numpy.searchsorted(values, value, side='right'):]
+		return self._order[numpy.searchsorted(values, value, side='left'):]
+
+INDEXES = {'hash': HashIndex, 'sorted': SortedIndex}
+
+def get_version(series):
+	'''
+	Cheap content version of a Series, which changes whenever its values do
+
+	Values are hashed column-wise by pandas, so even in place edits of a
+	DataFrame's columns are detected.
+
+	Args:
+		series (Series): Column to be versioned.
+
+	Returns:
+		tuple of length and hash
+	'''
+	hashes = hash_pandas_object(series, index=False).values
+	return (len(series), hash(hashes.tobytes()))
+# ------------------------------------------------------------------------------
+
+def main():
+	'''
+	Run help if called directly
+	'''
+
+	import __main__
+	help(__main__)
+
+__all__ = ['StitchIndex', 'HashIndex', 'SortedIndex', 'INDEXES', 'get_version']
+
+if __name__ == '__main__':
+	main()
@@ -1,10 +1,15 @@
 from __future__ import with_statement, print_function, absolute_import
 from itertools import *
 from functools import *
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from numbers import Number
 import numpy
 import pandas
+from pandas.api.types import infer_dtype, is_numeric_dtype, is_categorical_dtype
 from stitch.core.stitch_parser import StitchParser
 from stitch.core.utils import *
+from stitch.core.errors import *
 # ------------------------------------------------------------------------------
 
 '''
@@ -15,6 +20,15 @@ from stitch.core.utils import *
 .. moduleauthor:: Alex Braun <alexander.g.braun@gmail.com>
 '''
 
+# Compiled query plans shared by all interpreters in the process
+PLAN_CACHE = LRUCache(maxsize=128)
+
+# Number of rows sampled for column statistics used by the query planner
+STATS_SAMPLE_SIZE = 1000
+
+# Minimum number of rows for which shared scans are run on a thread pool
+PARALLEL_ROWS = 100000
+
 class StitchInterpreter(StitchParser):
 	'''
 	Subclass of StitchParser used for performing stitchql queries on supplied DataFrames
@@ -22,11 +36,383 @@ class StitchInterpreter(StitchParser):
 	Attributes:
 		last_search (str): Last stitchql query generated. Default: None.
 		search_stats(str): Print statistics about the last query made.
+		engine (str): Query execution engine, vector or cell. Default: vector.
+		or_mode (str): Evaluation of OR queries, auto, shared or narrow. Default: auto.
+		threads (int): Thread pool size used by shared scans. Default: None.
+		plan_cache (LRUCache): Process-wide cache of compiled query plans.
 	'''
-	def __init__(self):
+	def __init__(self, engine='vector', or_mode='auto', threads=None):
+		'''StitchInterpreter initializer
+
+		Args:
+			engine (str, optional): Query execution engine. Default: vector.
+				vector: evaluates each query column-wise with NumPy/pandas operations.
+				cell: evaluates each query cell by cell with bool_test.
+			or_mode (str, optional): Evaluation of OR (|) queries by the vector engine. Default: auto.
+				narrow: each compound query narrows its own rows independently.
+				shared: every distinct query is evaluated once, in a single pass,
+					and its mask is shared by all the compound queries using it.
+				auto: shared if any query appears in more than one compound query.
+				Frames whose index is not sorted are always queried narrowly.
+			threads (int, optional): Thread pool size for shared scans over
+				frames of at least PARALLEL_ROWS rows. Default: None (no pool).
+		'''
 		super(StitchInterpreter, self).__init__()
+		if engine not in ['vector', 'cell']:
+			raise BadArgument('Improper engine supplied. Should be vector or cell. Value provided: ' + str(engine))
+		if or_mode not in ['auto', 'shared', 'narrow']:
+			raise BadArgument('Improper or_mode supplied. Should be auto, shared or narrow. Value provided: ' + str(or_mode))
+		self._engine = engine
+		self._or_mode = or_mode
+		self._threads = threads
+
+	@property
+	def engine(self):
+		return self._engine
+
+	@property
+	def or_mode(self):
+		return self._or_mode
+
+	@property
+	def threads(self):
+		return self._threads
+
+	@property
+	def plan_cache(self):
+		return PLAN_CACHE
 	# --------------------------------------------------------------------------
 
+	def _get_columns(self, dataframe, fields=['all'], field_operator='=='):
+		'''
+		Semi-private method for resolving stitchql fields into column positions.
+
+		Args:
+			dataframe (DataFrame): DataFrame to query.
+			fields (list, optional): Fields to query. Default: ['all'].
+			field_operator (str, optional): Operator used for determining matching fields. Default '=='.
+
+		Returns:
+			List of column positions
+		'''
+		columns = dataframe.columns.tolist()
+		if fields == ['all']:
+			return list(range(len(columns)))
+		return [i for i, x in enumerate(columns) if bool_test(x, field_operator, fields)]
+
+	def _gen_dataframe_mask(self, dataframe, columns, operator='==', values=[''], positions=None, indexes=None):
+		'''
+		Semi-private method for processing invidual compiled stitchql queries column-wise.
+
+		Args:
+			dataframe (DataFrame): DataFrame to query.
+			columns (list): Positions of columns to query.
+			operator (str, optional): stitchql operator to use in the query. Default '=='.
+			values (list, optional): Values to look for. Default [''].
+			positions (ndarray, optional): Positions of rows to query. Default: None (all rows).
+			indexes (dict, optional): StitchIndexes keyed by column name. Default: None.
+
+		Returns:
+			Boolean ndarray of matching rows
+		'''
+		size = len(dataframe) if positions is None else len(positions)
+		mask = numpy.zeros(size, dtype=bool)
+		for i in columns:
+			index = self._get_index(dataframe, i, indexes)
+			if index is not None and index.supports(operator, values):
+				result = index.lookup(operator, values)
+				if positions is not None:
+					result = result[positions]
+				mask |= result
+				continue
+
+			series = dataframe.iloc[:, i]
+			if positions is not None:
+				series = series.iloc[positions]
+			mask |= vector_test(series, operator, values)
+		return mask
+
+	def _get_index(self, dataframe, column, indexes):
+		'''Semi-private method for retrieving the StitchIndex of a column position, if any'''
+		if not indexes:
+			return None
+		return indexes.get(dataframe.columns[column])
+
+	def _compile(self, dataframe, field_operator='=='):
+		'''
+		Semi-private method for compiling the last search into a query plan.
+
+		Fields are resolved into column positions, so that a plan can be
+		executed against any DataFrame with the same columns.
+
+		Args:
+			dataframe (DataFrame): DataFrame to compile plan against.
+			field_operator (str, optional): Operator used for determining matching fields. Default '=='.
+
+		Returns:
+			Query plan
+		'''
+		plan = {'search': self._last_search, 'queries': []}
+		for queries in self._last_search:
+			compound_query = []
+			for q in queries:
+				query = {}
+				query['columns'] = self._get_columns(dataframe, q['fields'], field_operator)
+				query['operator'] = q['operator']
+				query['values'] = q['values']
+				compound_query.append(query)
+			plan['queries'].append(compound_query)
+		return plan
+
+	def _column_stats(self, series):
+		'''
+		Semi-private method for gathering cheap statistics from a sample of a column.
+
+		Args:
+			series (Series): Column to be sampled.
+
+		Returns:
+			dict of distinct count, null fraction, min, max and kind
+		'''
+		step = max(len(series) // STATS_SAMPLE_SIZE, 1)
+		sample = series.iloc[::step]
+		stats = {'distinct': 0, 'null_fraction': 0.0, 'min': None, 'max': None}
+		stats['kind'] = 'numeric' if is_numeric_dtype(series.dtype) else 'object'
+		if len(sample) == 0:
+			return stats
+
+		nulls = sample.isnull()
+		stats['null_fraction'] = nulls.mean()
+		if stats['kind'] == 'numeric':
+			stats['min'] = sample.min()
+			stats['max'] = sample.max()
+		else:
+			try:
+				stats['distinct'] = sample.nunique()
+			except TypeError:
+				# unhashable items
+				stats['distinct'] = len(sample)
+			if is_categorical_dtype(series.dtype):
+				stats['kind'] = 'categorical'
+			elif infer_dtype(sample, skipna=True) not in ['string', 'empty']:
+				stats['kind'] = 'mixed'
+		if stats['kind'] == 'numeric':
+			stats['distinct'] = sample.nunique()
+		return stats
+
+	def _estimate(self, stats, operator, values):
+		'''
+		Semi-private method for estimating the per row cost and selectivity of a query on a column.
+
+		Args:
+			stats (dict): Column statistics generated by _column_stats.
+			operator (str): stitchql operator.
+			values (list): Query values.
+
+		Returns:
+			(cost, selectivity) tuple
+		'''
+		present = 1.0 - stats['null_fraction']
+		numeric = stats['kind'] == 'numeric' and stats['min'] is not None
+
+		cost = 1.0
+		if operator in ['re', 're.IGNORECASE', 'nre', 'nre.IGNORECASE']:
+			cost = 20.0
+		elif stats['kind'] == 'mixed':
+			cost = 50.0
+
+		miss = 1.0
+		for value in as_iterable(values):
+			if operator in ['==', '!=']:
+				sel = present / max(stats['distinct'], 1)
+				if numeric:
+					if not isinstance(value, Number) or not stats['min'] <= value <= stats['max']:
+						sel = 0.0
+				if operator == '!=':
+					sel = 1.0 - sel
+
+			elif operator in ['<', '<=', '>', '>=']:
+				sel = 1 / 3.0
+				if numeric and isinstance(value, Number):
+					span = float(stats['max'] - stats['min'])
+					sel = 1.0 if value >= stats['max'] else 0.0
+					if span > 0:
+						sel = min(max((value - stats['min']) / span, 0.0), 1.0)
+					if operator in ['>', '>=']:
+						sel = 1.0 - sel
+					sel *= present
+
+			elif operator.startswith('nre'):
+				sel = 0.75
+			else:
+				sel = 0.25
+			miss *= 1.0 - sel
+		return cost, 1.0 - miss
+
+	def _plan_compound(self, dataframe, queries, stats, indexes=None):
+		'''
+		Semi-private method for ordering the queries of a compound (AND) query.
+
+		Queries are ordered by ascending cost / (1 - selectivity), so that cheap,
+		selective queries narrow the rows seen by expensive ones.
+
+		Args:
+			dataframe (DataFrame): DataFrame to be queried.
+			queries (list): Compiled queries of a compound query.
+			stats (dict): Column statistics, keyed by column position. Filled on demand.
+			indexes (dict, optional): StitchIndexes keyed by column name. Default: None.
+
+		Returns:
+			Ordered list of queries
+		'''
+		if len(queries) < 2:
+			return queries
+
+		ranks = []
+		for q in queries:
+			cost = 0.0
+			miss = 1.0
+			for i in q['columns']:
+				if i not in stats:
+					stats[i] = self._column_stats(dataframe.iloc[:, i])
+				c, sel = self._estimate(stats[i], q['operator'], q['values'])
+				index = self._get_index(dataframe, i, indexes)
+				if index is not None and index.supports(q['operator'], q['values']):
+					c = 0.1
+				cost += c
+				miss *= 1.0 - sel
+			ranks.append(cost / max(miss, 1e-6))
+		order = sorted(range(len(queries)), key=lambda x: ranks[x])
+		return [queries[i] for i in order]
+
+	def _query_key(self, query):
+		return (tuple(query['columns']), query['operator'], tuple(query['values']))
+
+	def _use_shared_scan(self, plan):
+		'''Semi-private method for determining whether a plan should be executed with a shared scan'''
+		if len(plan['queries']) < 2 or self._or_mode == 'narrow':
+			return False
+		if self._or_mode == 'shared':
+			return True
+		keys = [set(self._query_key(q) for q in queries) for queries in plan['queries']]
+		for i, key in enumerate(keys):
+			for other in keys[i + 1:]:
+				if key & other:
+					return True
+		return False
+
+	def _execute_shared(self, dataframe, plan, indexes=None):
+		'''
+		Semi-private method for executing a compiled query plan with a shared scan.
+
+		Every distinct query is evaluated at most once per row and its mask is
+		shared by all compound queries using it.  Each compound query only
+		considers rows not already matched by a previous one.  Frames of at
+		least PARALLEL_ROWS rows are evaluated on a thread pool up front, if
+		threads is set.
+
+		Args:
+			dataframe (DataFrame): DataFrame to query.
+			plan (dict): Query plan generated by _compile.
+			indexes (dict, optional): StitchIndexes keyed by column name. Default: None.
+
+		Returns:
+			Boolean ndarray of matching rows
+		'''
+		size = len(dataframe)
+		queries = OrderedDict()
+		for compound_query in plan['queries']:
+			for q in compound_query:
+				queries.setdefault(self._query_key(q), q)
+
+		# key: [mask, rows for which mask has been computed]
+		masks = {}
+		if self._threads and size >= PARALLEL_ROWS and len(queries) > 1:
+			func = lambda q: self._gen_dataframe_mask(dataframe, q['columns'], q['operator'], q['values'], indexes=indexes)
+			pool = ThreadPool(self._threads)
+			try:
+				results = pool.map(func, list(queries.values()))
+			finally:
+				pool.close()
+			for key, result in zip(queries.keys(), results):
+				masks[key] = [result, numpy.ones(size, dtype=bool)]
+
+		def _shared_mask(q, positions):
+			key = self._query_key(q)
+			if key not in masks:
+				masks[key] = [numpy.zeros(size, dtype=bool), numpy.zeros(size, dtype=bool)]
+			mask, computed = masks[key]
+			todo = positions[~computed[positions]]
+			if len(todo) == size:
+				mask[:] = self._gen_dataframe_mask(dataframe, q['columns'], q['operator'], q['values'], indexes=indexes)
+				computed[:] = True
+			elif len(todo) > 0:
+				mask[todo] = self._gen_dataframe_mask(dataframe, q['columns'], q['operator'], q['values'], positions=todo, indexes=indexes)
+				computed[todo] = True
+			return mask[positions]
+
+		stats = {}
+		mask = numpy.zeros(size, dtype=bool)
+		for compound_query in plan['queries']:
+			positions = numpy.flatnonzero(~mask)
+			for q in self._plan_compound(dataframe, compound_query, stats, indexes=indexes):
+				if len(positions) == 0:
+					break
+				positions = positions[_shared_mask(q, positions)]
+			mask[positions] = True
+		return mask
+
+	def _execute(self, dataframe, plan, indexes=None):
+		'''
+		Semi-private method for executing a compiled query plan.
+
+		Each compound (AND) query is ordered by _plan_compound and narrows the
+		rows passed to the following query by integer position. A compound
+		query stops as soon as no rows remain.  Plans with OR queries may be
+		executed with a shared scan instead, according to or_mode.
+
+		Results are ordered as those of the cell engine, whose OR merges sort
+		them by index.  A sorted index is already in that order.  Otherwise,
+		the results of each compound query are merged by the same unions,
+		which requires the narrow scan.
+
+		Args:
+			dataframe (DataFrame): DataFrame to query.
+			plan (dict): Query plan generated by _compile.
+			indexes (dict, optional): StitchIndexes keyed by column name. Default: None.
+
+		Returns:
+			Results DataFrame
+		'''
+		if dataframe.index.has_duplicates:
+			raise IndexError('DataFrame has non-unique values in its index')
+
+		ordered = dataframe.index.is_monotonic_increasing
+		if ordered and self._use_shared_scan(plan):
+			return dataframe[self._execute_shared(dataframe, plan, indexes=indexes)]
+
+		stats = {}
+		mask = numpy.zeros(len(dataframe), dtype=bool)
+		union = pandas.Index([])
+		for queries in plan['queries']:
+			positions = None
+			for q in self._plan_compound(dataframe, queries, stats, indexes=indexes):
+				if positions is None:
+					positions = numpy.flatnonzero(
+						self._gen_dataframe_mask(dataframe, q['columns'], q['operator'], q['values'], indexes=indexes))
+				else:
+					positions = positions[self._gen_dataframe_mask(dataframe, q['columns'], q['operator'], q['values'], positions=positions, indexes=indexes)]
+				if len(positions) == 0:
+					break
+			if positions is not None:
+				mask[positions] = True
+				if not ordered:
+					union = union.union(dataframe.index[positions])
+
+		if not ordered:
+			return dataframe.ix[union]
+		return dataframe[mask]
+
 	def _gen_dataframe_query(self, dataframe, fields=['all'], operator='==', values=[''], field_operator='=='):
 		'''
 		Semi-private method for processing invidual stitchql queries.
@@ -52,17 +438,22 @@ class StitchInterpreter(StitchParser):
 		mask.dropna(how='all', subset=columns, inplace=True)
 		return mask.index
 
-	def dataframe_query(self, dataframe, field_operator='=='):
+	def dataframe_query(self, dataframe, field_operator='==', indexes=None):
 		'''
 		Query supplied DataFrame using last search.
 
 		Args:
 			dataframe (DataFrame): DataFrame to query.
 			field_operator (str, optional): Operator used for determining matching fields. Default '=='.
+			indexes (dict, optional): StitchIndexes keyed by column name, used by the vector engine. Default: None.
 
 		Returns:
 			Results DataFrame
 		'''
+		if self._engine == 'vector':
+			plan = self._compile(dataframe, field_operator=field_operator)
+			return self._execute(dataframe, plan, indexes=indexes)
+
 		if dataframe.index.has_duplicates:
 			raise IndexError('DataFrame has non-unique values in its index')
 
@@ -73,6 +464,36 @@ class StitchInterpreter(StitchParser):
 				and_mask = self._gen_dataframe_query(dataframe.ix[and_mask], q['fields'], q['operator'], q['values'], field_operator=field_operator)
 			mask = mask.union(and_mask)
 		return dataframe.ix[mask]
+
+	def query(self, dataframe, string, field_operator='==', indexes=None):
+		'''
+		Query supplied DataFrame with a stitchql string, using cached query plans.
+
+		Plans are cached in PLAN_CACHE by query string, field operator and
+		column names, so repeated queries skip both parsing and field resolution.
+
+		Args:
+			dataframe (DataFrame): DataFrame to query.
+			string (str): stitchql formatted string.
+			field_operator (str, optional): Operator used for determining matching fields. Default '=='.
+			indexes (dict, optional): StitchIndexes keyed by column name, used by the vector engine. Default: None.
+
+		Returns:
+			Results DataFrame
+		'''
+		if self._engine != 'vector':
+			self.search(string)
+			return self.dataframe_query(dataframe, field_operator=field_operator)
+
+		key = (string, field_operator, tuple(dataframe.columns.tolist()))
+		plan = PLAN_CACHE.get(key)
+		if plan is None:
+			self.search(string)
+			plan = self._compile(dataframe, field_operator=field_operator)
+			PLAN_CACHE.put(key, plan)
+		else:
+			self._last_search = plan['search']
+		return self._execute(dataframe, plan, indexes=indexes)
 # ------------------------------------------------------------------------------
 
 def main():
@@ -83,7 +504,7 @@ def main():
 	import __main__
 	help(__main__)
 
-__all__ = ['StitchInterpreter']
+__all__ = ['StitchInterpreter', 'PLAN_CACHE', 'STATS_SAMPLE_SIZE', 'PARALLEL_ROWS']
 
 if __name__ == '__main__':
 	main()
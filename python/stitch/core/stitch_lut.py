@@ -1,6 +1,7 @@
 from __future__ import with_statement, print_function, absolute_import
 from itertools import *
 from functools import *
+import os
 import re
 import warnings
 from collections import OrderedDict
@@ -31,19 +32,29 @@ class StitchLUT(Base):
 	Attributes:
 		keys (DataFrame): Input data that has been reduced to unique values.
 		values (DataFrame): Numeric values mapped to the keys.
+
+	Lookups are made against per-column dictionaries of keys to values and
+	values to keys.  Each column's dictionaries are built on its first lookup
+	and discarded whenever values are generated or read, so that memory
+	mapped values are only read for the columns actually used.
 	'''
-	def __init__(self, data=None, null='missing data', null_value=-1.0):
+	def __init__(self, data=None, null='missing data', null_value=-1.0, dtype=numpy.float64):
 		'''StitchLUT initializer
 
 		Args:
 			data (DataFrame): Keys data.
 			null (string, optional): Placeholder for missing keys data. Default: 'missing data'.
 			null_value (int, optional): Placeholder value for missing values data. Default: -1.0.
+			dtype (type, optional): NumPy dtype of the values table. float32 and
+				int32 halve its size, float32 is exact up to 2**24 keys. Default: float64.
 		'''
 		self._null = null
 		self._null_value = null_value
+		self._dtype = dtype
 		self._keys = None
 		self._values = None
+		self._key_maps = {}
+		self._value_maps = {}
 		if type(data) != None:
 			self.ingest(data)
 
@@ -67,25 +78,59 @@ class StitchLUT(Base):
 		self._reduce_keys()
 		self.generate_values()
 
-	def generate_values(self, start=1, step=1):
+	def generate_values(self, start=1, step=1, dtype=None):
 		'''Generate a table of floating point values according to the keys table
 
+		Values run from start, by step, down each column in turn, repeating
+		from start whenever they exceed the number of rows.
+
 		Args:
 			start (int, optional): Minimum floating point value. Default: 1.
 			step (int, optional): Amount to step between values. Default 1.
+			dtype (type, optional): NumPy dtype of the values. Default: LUT dtype.
 
 		Returns:
 			None
 		'''
-		data = self._keys._data.copy()
-		mask = data.applymap(lambda x: bool_test(x, '==', [self._null]))
-		x, y = data.shape
-		x += start
-		vals = cycle(range(start, x, step))
-		data = data.applymap(lambda x: vals.next())
-		data[mask] = self._null_value
-		data = data.applymap(lambda x: float(x))
+		if dtype is None:
+			dtype = self._dtype
+
+		keys = self._keys._data
+		rows, columns = keys.shape
+		values = numpy.arange(start, rows + start, step, dtype=dtype)
+		if values.size > 0:
+			positions = numpy.arange(rows * columns).reshape(columns, rows).T
+			values = values[positions % values.size]
+		else:
+			values = numpy.empty((rows, columns), dtype=dtype)
+
+		mask = (keys == self._null).values
+		values = numpy.where(mask, numpy.array(self._null_value, dtype=dtype), values)
+		data = DataFrame(values, index=keys.index, columns=keys.columns)
 		self._values = StitchFrame(data)
+		self._reset_maps()
+
+	def _reset_maps(self):
+		'''Semi-private method for discarding the key and value dictionaries of every column'''
+		self._key_maps = {}
+		self._value_maps = {}
+
+	def _get_maps(self, column):
+		'''Semi-private method for fetching the key and value dictionaries of a column
+
+		The dictionaries are built on first use.  The first row of a duplicated
+		key or value takes precedence, as it would in a search of the keys or
+		values table.
+
+		Returns:
+			(key map, value map) tuple
+		'''
+		if column not in self._key_maps:
+			keys = self._keys._data[column].tolist()[::-1]
+			values = self._values._data[column].tolist()[::-1]
+			self._value_maps[column] = dict(zip(values, keys))
+			self._key_maps[column] = dict(zip(keys, values))
+		return self._key_maps[column], self._value_maps[column]
 
 	def read_json(self, string, keys_only=True, orient='records'):
 		'''
@@ -109,6 +154,7 @@ class StitchLUT(Base):
 			data = json.loads(string, orient=orient)
 			self._keys = StitchFrame(data['keys'])
 			self._values = StitchFrame(data['values'])
+			self._reset_maps()
 
 	def to_json(self, keys_only=True, orient='records'):
 		'''Write internal data to a JSON string
@@ -127,6 +173,69 @@ class StitchLUT(Base):
 			output['keys'] = self._keys._data.to_dict()
 			output['values'] = self._values._data.to_dict()
 			return json.dumps(output, orient=orient)
+
+	def write_compiled(self, filepath, checksum=None):
+		'''Write keys and values to a compiled LUT, to be read by read_compiled
+
+		Keys and settings are written as JSON to filepath, values as a NumPy
+		array to filepath + '.npy'.
+
+		Args:
+			filepath (str): Fullpath of compiled LUT.
+			checksum (str, optional): Checksum of the data the LUT was built from. Default: None.
+
+		Returns:
+			None
+		'''
+		values = numpy.asarray(self._values._data.values, dtype=self._dtype)
+		temp = filepath + '.npy.tmp'
+		with open(temp, 'wb') as f:
+			numpy.save(f, values)
+		os.rename(temp, filepath + '.npy')
+
+		# keys are written last, so a partially written LUT is never read
+		header = {
+			'keys': json.loads(self._keys._data.to_json(orient='split')),
+			'null': self._null,
+			'null_value': self._null_value,
+			'shape': list(values.shape),
+			'checksum': checksum
+		}
+		temp = filepath + '.tmp'
+		with open(temp, 'w') as f:
+			json.dump(header, f)
+		os.rename(temp, filepath)
+
+	def read_compiled(self, filepath, checksum=None, mmap_mode='r'):
+		'''Read keys and values from a compiled LUT
+
+		Args:
+			filepath (str): Fullpath of compiled LUT.
+			checksum (str, optional): Expected checksum of the LUT. Default: None.
+			mmap_mode (str, optional): Memory map mode of values, None reads
+				them into memory. Default: 'r'.
+
+		Returns:
+			None
+		'''
+		with open(filepath, 'r') as f:
+			header = json.load(f)
+		if checksum is not None and header['checksum'] != checksum:
+			raise NotFound('Compiled LUT is out of date: ' + filepath)
+
+		values = numpy.load(filepath + '.npy', mmap_mode=mmap_mode)
+		if list(values.shape) != header['shape']:
+			raise NotFound('Compiled LUT values do not match its keys: ' + filepath)
+
+		keys = header['keys']
+		keys = DataFrame(keys['data'], index=keys['index'], columns=keys['columns'])
+		self._null = header['null']
+		self._null_value = header['null_value']
+		self._dtype = values.dtype.type
+		self._keys = StitchFrame(keys)
+		self._values = StitchFrame(DataFrame(values, index=keys.index, columns=keys.columns,
+											 copy=False))
+		self._reset_maps()
 	# --------------------------------------------------------------------------
 
 	@property
@@ -212,6 +321,46 @@ class StitchLUT(Base):
 		else:
 			return _transform_item(item)
 
+	def get_transform(self, source_column, target_column):
+		'''Map every key of a source column to the key of a target column sharing its value
+
+		Args:
+			source_column (str): Source column.
+			target_column (str): Target column.
+
+		Returns:
+			dict of source keys to target keys, or NaN where no target key exists
+		'''
+		targets = self._get_maps(target_column)[1]
+		output = {}
+		for key, value in self._get_maps(source_column)[0].items():
+			output[key] = targets.get(value, numpy.nan)
+		return output
+
+	def transform(self, items, source_column, target_column):
+		'''Transform items from keys of a source column into keys of a target column
+
+		Batch equivalent of transform_items with the = operator.  A single
+		mapping is built between the columns and applied to all items at once.
+
+		Args:
+			items (item, list or Series): Items to be transformed.
+			source_column (str): Source column.
+			target_column (str): Target column.
+
+		Returns:
+			Transformed items of the same type.  Items not found in the source
+			column are returned unchanged.
+		'''
+		lut = self.get_transform(source_column, target_column)
+		if isinstance(items, Series):
+			mask = items.isin(list(lut.keys()))
+			return items.where(~mask, items.map(lut))
+
+		if is_iterable(items) and not isinstance(items, str):
+			return [lut.get(item, item) for item in items]
+		return lut.get(items, items)
+
 	def make_numerical(self, data, spql=False):
 		'''Convert supplied data to its numerical equivalents determined by lookups.
 
@@ -225,7 +374,10 @@ class StitchLUT(Base):
 		data = data.copy()
 		columns = data.columns.tolist()
 		for col in columns:
-			data[col] = data[col].apply(lambda x: self.lookup_item(x, col, spql=spql))
+			if spql:
+				data[col] = data[col].apply(lambda x: self.lookup_item(x, col, spql=spql))
+			else:
+				data[col] = data[col].map(self._get_maps(col)[0])
 		return data
 
 	def lookup_item(self, item, column, spql=False, operator='=', verbosity=None):
@@ -247,13 +399,26 @@ class StitchLUT(Base):
 			output = self.stitch_lookup(search, verbosity=verbosity)
 			return output
 
-		mask = self._keys._data[column].apply(lambda x: x == item)
-		result = self._values._data[mask]
-		result = result[column]
-		if not result.empty:
-			output = result.tolist()[0]
-			return output
-		else:
+		return self._map_item(self._get_maps(column)[0], item, column, verbosity)
+
+	def reverse_lookup_item(self, value, column, verbosity=None):
+		'''Lookup key of given value within a specified column.
+
+		Args:
+			value (float): Value to be queried.
+			column (str): Lookup column.
+			verbosity (str, optional): Level of verbosity (error, warn or None). Default: None
+
+		Returns:
+			key
+		'''
+		return self._map_item(self._get_maps(column)[1], value, column, verbosity)
+
+	def _map_item(self, lut, item, column, verbosity):
+		'''Semi-private method for looking up an item in the dictionary of a column'''
+		try:
+			return lut[item]
+		except (KeyError, TypeError):
 			message = 'No results found. item: ' + str(item) + ' column: ' + str(column)
 			if verbosity == 'error':
 				raise NotFound(message)
@@ -1,6 +1,7 @@
 from __future__ import with_statement, print_function, absolute_import
 from itertools import *
 from functools import *
+import threading
 from pyparsing import printables, nums
 from pyparsing import Word, Keyword, Or, Group
 from pyparsing import delimitedList, oneOf, OneOrMore, Suppress
@@ -15,6 +16,58 @@ from stitch.core.utils import Base
 .. moduleauthor:: Alex Braun <alexander.g.braun@gmail.com>
 '''
 
+_GRAMMAR = None
+_GRAMMAR_LOCK = threading.Lock()
+
+def _build_grammar():
+	'''Build the stitchql pyparsing grammar'''
+	all_chars            = printables + ' '
+	regex                = Suppress('"') + Word(all_chars, excludeChars=',")') + Suppress('"')
+	word                 = Word(printables, excludeChars=',")')
+	float_               = Word(nums + '.' + nums).setParseAction(lambda s,l,t: float(t[0]))
+	integer              = Word(nums).setParseAction(lambda s,l,t: int(t[0]))
+	number               = Or([float_, integer])
+	item                 = Or([number, word, regex])
+	items                = delimitedList(OneOrMore(item))
+	fields               = Group(Suppress('(') + items + Suppress(')')).setResultsName('fields')
+	values               = Group(Suppress('(') + items + Suppress(')')).setResultsName('values')
+	is_                  = oneOf(['is',                                '='], caseless=True).setParseAction(lambda s,l,t: '==')
+	isnot                = oneOf(['is not',                 'isnot',  '!='], caseless=True).setParseAction(lambda s,l,t: '!=')
+	contains             = oneOf(['contains',                'cont',   '~'], caseless=True).setParseAction(lambda s,l,t: 're.IGNORECASE')
+	does_not_contain     = oneOf(['does not contain',     'notcont',  '!~'], caseless=True).setParseAction(lambda s,l,t: 'nre.IGNORECASE')
+	cs_contains          = oneOf(['cscontains',            'cscont',  '~~'], caseless=True).setParseAction(lambda s,l,t: 're')
+	cs_does_not_contain  = oneOf(['does not cscontain', 'csnotcont', '!~~'], caseless=True).setParseAction(lambda s,l,t: 'nre')
+	greater_than         = oneOf(['greater than',              'gt',   '>'], caseless=True).setParseAction(lambda s,l,t: '>')
+	greater_than_equal   = oneOf(['greater than equal to',    'gte',  '>='], caseless=True).setParseAction(lambda s,l,t: '>=')
+	less_than            = oneOf(['less than',                 'ls',   '<'], caseless=True).setParseAction(lambda s,l,t: '<')
+	less_than_equal      = oneOf(['less than equal to',       'lte',  '<='], caseless=True).setParseAction(lambda s,l,t: '<=')
+	operator             = isnot | is_ | cs_contains | cs_does_not_contain | contains | does_not_contain | greater_than_equal | greater_than | less_than_equal | less_than
+	operator             = operator.setResultsName('operator')
+	and_                 = Keyword('&')
+	or_                  = Keyword('|')
+	query                = Group(fields + operator + values)
+	compound_query       = Group(delimitedList(query, delim=and_))
+	fragment             = OneOrMore(compound_query)
+	line                 = delimitedList(fragment, delim=or_)
+	return line
+
+def get_grammar():
+	'''
+	Return the stitchql grammar, building it on first use
+
+	The grammar is built once per process and shared, read-only, by all
+	StitchParsers.
+
+	Returns:
+		pyparsing grammar.
+	'''
+	global _GRAMMAR
+	if _GRAMMAR is None:
+		with _GRAMMAR_LOCK:
+			if _GRAMMAR is None:
+				_GRAMMAR = _build_grammar()
+	return _GRAMMAR
+
 class StitchParser(Base):
 	'''
 	Class for generating queries for which to filter DataFrames
@@ -25,37 +78,12 @@ class StitchParser(Base):
 	'''
 
 	def __init__(self):
-		all_chars            = printables + ' '
-		regex                = Suppress('"') + Word(all_chars, excludeChars=',")') + Suppress('"')
-		word                 = Word(printables, excludeChars=',")')
-		float_               = Word(nums + '.' + nums).setParseAction(lambda s,l,t: float(t[0]))
-		integer              = Word(nums).setParseAction(lambda s,l,t: int(t[0]))
-		number               = Or([float_, integer])
-		item                 = Or([number, word, regex])
-		items                = delimitedList(OneOrMore(item))
-		fields               = Group(Suppress('(') + items + Suppress(')')).setResultsName('fields')
-		values               = Group(Suppress('(') + items + Suppress(')')).setResultsName('values')
-		is_                  = oneOf(['is',                                '='], caseless=True).setParseAction(lambda s,l,t: '==')
-		isnot                = oneOf(['is not',                 'isnot',  '!='], caseless=True).setParseAction(lambda s,l,t: '!=')
-		contains             = oneOf(['contains',                'cont',   '~'], caseless=True).setParseAction(lambda s,l,t: 're.IGNORECASE')
-		does_not_contain     = oneOf(['does not contain',     'notcont',  '!~'], caseless=True).setParseAction(lambda s,l,t: 'nre.IGNORECASE')
-		cs_contains          = oneOf(['cscontains',            'cscont',  '~~'], caseless=True).setParseAction(lambda s,l,t: 're')
-		cs_does_not_contain  = oneOf(['does not cscontain', 'csnotcont', '!~~'], caseless=True).setParseAction(lambda s,l,t: 'nre')
-		greater_than         = oneOf(['greater than',              'gt',   '>'], caseless=True).setParseAction(lambda s,l,t: '>')
-		greater_than_equal   = oneOf(['greater than equal to',    'gte',  '>='], caseless=True).setParseAction(lambda s,l,t: '>=')
-		less_than            = oneOf(['less than',                 'ls',   '<'], caseless=True).setParseAction(lambda s,l,t: '<')
-		less_than_equal      = oneOf(['less than equal to',       'lte',  '<='], caseless=True).setParseAction(lambda s,l,t: '<=')
-		operator             = isnot | is_ | cs_contains | cs_does_not_contain | contains | does_not_contain | greater_than_equal | greater_than | less_than_equal | less_than
-		operator             = operator.setResultsName('operator')
-		and_                 = Keyword('&')
-		or_                  = Keyword('|')
-		query                = Group(fields + operator + values)
-		compound_query       = Group(delimitedList(query, delim=and_))
-		fragment             = OneOrMore(compound_query)
-		self._line           = delimitedList(fragment, delim=or_)
-
 		self._last_search = None
 
+	@property
+	def _line(self):
+		return get_grammar()
+
 	@property
 	def last_search(self):
 		return self._last_search
@@ -109,7 +137,7 @@ def main():
 	import __main__
 	help(__main__)
 
-__all__ = ['StitchParser']
+__all__ = ['StitchParser', 'get_grammar']
 
 if __name__ == '__main__':
 	main()
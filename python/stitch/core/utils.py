@@ -3,13 +3,22 @@ from itertools import *
 from functools import *
 import warnings
 import re
+import threading
+import operator as operator_module
 from copy import copy, deepcopy
 from decimal import Decimal
+from numbers import Number
 import numpy as np
 import pandas as pd
 from pandas import DataFrame, Series
+from pandas.api.types import infer_dtype, is_numeric_dtype, is_categorical_dtype
 from collections import OrderedDict, namedtuple
 from xattr import xattr
+
+try:
+	string_types = basestring
+except NameError:
+	string_types = str
 # ------------------------------------------------------------------------------
 
 '''
@@ -48,6 +57,71 @@ class Base(object):
 				print(item)
 # ------------------------------------------------------------------------------
 
+class LRUCache(Base):
+	'''Thread-safe, bounded least-recently-used cache
+
+	Attributes:
+		maxsize (int): Maximum number of items held by the cache.
+		stats (dict): Hits, misses, current size and maxsize of the cache.
+	'''
+	def __init__(self, maxsize=128):
+		self._maxsize = maxsize
+		self._items = OrderedDict()
+		self._lock = threading.Lock()
+		self._hits = 0
+		self._misses = 0
+
+	@property
+	def maxsize(self):
+		return self._maxsize
+
+	@maxsize.setter
+	def maxsize(self, value):
+		with self._lock:
+			self._maxsize = value
+			self._trim()
+
+	@property
+	def stats(self):
+		return {'hits': self._hits, 'misses': self._misses,
+				'size': len(self._items), 'maxsize': self._maxsize}
+
+	def __len__(self):
+		return len(self._items)
+
+	def __contains__(self, key):
+		return key in self._items
+
+	def _trim(self):
+		while len(self._items) > self._maxsize:
+			self._items.popitem(last=False)
+
+	def get(self, key, default=None):
+		'''Return cached item and mark it as recently used, or default on a miss'''
+		with self._lock:
+			if key in self._items:
+				value = self._items.pop(key)
+				self._items[key] = value
+				self._hits += 1
+				return value
+			self._misses += 1
+			return default
+
+	def put(self, key, value):
+		'''Add item to cache, evicting the least recently used item if full'''
+		with self._lock:
+			self._items.pop(key, None)
+			self._items[key] = value
+			self._trim()
+
+	def clear(self):
+		'''Remove all items and reset stats'''
+		with self._lock:
+			self._items.clear()
+			self._hits = 0
+			self._misses = 0
+# ------------------------------------------------------------------------------
+
 def as_type(item, dtype):
 	'''Convert item to given type'''
 	try:
@@ -93,6 +167,9 @@ def set_decimal_expansion(item, expansion):
 
 def round_to(item, order):
 	'''Rounds a given number to a given order of magnitudes after the decimal'''
+	if isinstance(item, np.generic):
+		# Decimal does not accept every numpy scalar
+		item = item.item()
 	return round(Decimal(item), order)
 
 def try_(item, func):
@@ -128,29 +205,66 @@ def _gt(item, value):
 def _gte(item, value):
 	return item >= value
 
+# Compiled stitchql regular expressions shared by all queries in the process
+REGEX_POOL = LRUCache(maxsize=256)
+
+def _combinable(patterns):
+	'''Determine if compiled patterns can be merged into a single alternation'''
+	for pattern in patterns:
+		if pattern.groups > 0 or pattern.pattern.startswith('(?'):
+			return False
+	return True
+
+def get_regex(values, ignore_case=False):
+	'''Return a compiled regex matching any of the given values, from REGEX_POOL
+
+	Multiple values are merged into a single alternation, unless one of them
+	contains groups or inline flags, in which case a list of compiled regexes
+	is returned instead.
+
+	Args:
+		values (list): Regular expression patterns.
+		ignore_case (bool, optional): Ignore case. Default: False
+
+	Returns:
+		Compiled regex or list of compiled regexes.
+	'''
+	values = tuple(str(x) for x in values)
+	key = (values, ignore_case)
+	regex = REGEX_POOL.get(key)
+	if regex is None:
+		flags = re.IGNORECASE if ignore_case else 0
+		regex = [re.compile(x, flags) for x in values]
+		if len(regex) == 1:
+			regex = regex[0]
+		elif _combinable(regex):
+			regex = re.compile('|'.join(['(?:' + x + ')' for x in values]), flags)
+		REGEX_POOL.put(key, regex)
+	return regex
+
 def _re(item, value):
-	found = re.search(str(value), str(item))
+	found = get_regex([value]).search(str(item))
 	if found:
 		return True
 	else:
 		return False
 
 def _reig(item, value):
-	found = re.search(str(value), str(item), flags=re.IGNORECASE)
+	found = get_regex([value], ignore_case=True).search(str(item))
 	if found:
 		return True
 	else:
 		return False
 
 def _nre(item, value):
-	found = re.search(str(value), str(item))
+	found = get_regex([value]).search(str(item))
 	if not found:
 		return True
 	else:
 		return False
 
 def _nreig(item, value):
-	found = re.search(str(value), str(item), flags=re.IGNORECASE)
+	found = get_regex([value], ignore_case=True).search(str(item))
 	if not found:
 		return True
 	else:
@@ -175,6 +289,110 @@ def bool_test(item, operator, values):
 		if op(item, value):
 			return True
 	return False
+
+def _is_number(item):
+	return isinstance(item, Number) and not isinstance(item, bool)
+
+def _str_contains(text, regex):
+	if is_listlike(regex):
+		mask = np.zeros(len(text), dtype=bool)
+		for item in regex:
+			mask |= _str_contains(text, item)
+		return mask
+
+	with warnings.catch_warnings():
+		# user supplied patterns may contain groups
+		warnings.simplefilter('ignore', UserWarning)
+		return text.str.contains(regex, regex=True).values.astype(bool)
+
+def _vector_regex(series, operator, values):
+	'''Vectorized equivalent of bool_test for regular expression operators'''
+	text = series
+	if infer_dtype(series, skipna=False) != 'string':
+		text = series.astype(str)
+	ignore_case = operator.endswith('IGNORECASE')
+
+	if operator.startswith('nre'):
+		# true if any value is not found, ie. not all values are found
+		mask = np.ones(len(series), dtype=bool)
+		for value in values:
+			mask &= _str_contains(text, get_regex([value], ignore_case))
+		return ~mask
+
+	return _str_contains(text, get_regex(values, ignore_case))
+
+def _vector_op(series, operator, value):
+	'''Vectorized equivalent of a single bool_test comparison
+
+	Returns a boolean ndarray, or None if the operation cannot be vectorized
+	without changing the results of bool_test.
+	'''
+	ops = { '==': operator_module.eq,
+			'!=': operator_module.ne,
+			'<':  operator_module.lt,
+			'<=': operator_module.le,
+			'>':  operator_module.gt,
+			'>=': operator_module.ge
+	}
+	op = ops[operator]
+
+	if is_numeric_dtype(series.dtype):
+		if _is_number(value):
+			return op(series.values, value)
+	elif infer_dtype(series, skipna=True) in ['string', 'empty']:
+		if isinstance(value, string_types):
+			if operator in ['==', '!=']:
+				return op(series.values, value).astype(bool)
+			if series.notnull().all():
+				return op(series.values, value).astype(bool)
+			return None
+	else:
+		return None
+
+	# mismatched types can only be resolved for equality
+	if operator == '==':
+		return np.zeros(len(series), dtype=bool)
+	if operator == '!=':
+		return np.ones(len(series), dtype=bool)
+	return None
+
+def vector_test(series, operator, values):
+	'''Perform a boolean operation between a Series and a given set of values
+
+	Vectorized equivalent of applying bool_test to every item in the Series.
+	Items of object Series with mixed types are tested individually with
+	bool_test.
+
+	Args:
+		series (Series): Series to be tested.
+		operator (str): bool_test operator.
+		values (list): Values to test against.
+
+	Returns:
+		Boolean ndarray.
+	'''
+	values = as_iterable(values)
+	if is_categorical_dtype(series.dtype):
+		# test each category once and broadcast through the codes
+		codes = series.cat.codes.values
+		categories = list(series.cat.categories)
+		if (codes == -1).any():
+			# null codes (-1) index a trailing null
+			categories.append(np.nan)
+		mask = vector_test(Series(categories), operator, values)
+		return mask[codes]
+
+	if operator in ['re', 're.IGNORECASE', 'nre', 'nre.IGNORECASE']:
+		return _vector_regex(series, operator, values)
+
+	mask = np.zeros(len(series), dtype=bool)
+	for value in values:
+		result = _vector_op(series, operator, value)
+		if result is None:
+			result = series.apply(lambda x: bool_test(x, operator, [value]))
+			result = result.values.astype(bool)
+		mask |= result
+	return mask
 # ------------------------------------------------------------------------------
 
 def regex_match(pattern, string, group=0, ignore_case=False):
@@ -626,6 +844,37 @@ def nan_to_bottom(series):
 	data = Series(list(data), index=series.index)
 	return data
 
+def compact_series(series, categorical_ratio=0.5):
+	'''Converts an object Series into a compact, typed Series
+
+	Columns of numbers become int or float Series, with nulls as NaN.  Columns
+	of strings become categoricals if the ratio of distinct values to rows is
+	no greater than categorical_ratio.  All other Series are returned as is.
+
+	Args:
+		series (Series): pandas Series object.
+		categorical_ratio (float, optional): Maximum ratio of distinct values to
+			rows for a string Series to be stored as a categorical. Default: 0.5
+
+	Returns:
+		Series
+	'''
+	if series.dtype != object:
+		return series
+
+	kind = infer_dtype(series, skipna=True)
+	if kind in ['integer', 'floating', 'mixed-integer-float', 'decimal']:
+		if series.notnull().all():
+			return pd.to_numeric(series)
+		return series.astype(float)
+
+	if kind == 'string':
+		distinct = series.nunique()
+		if distinct <= len(series) * categorical_ratio:
+			return series.astype('category')
+
+	return series
+
 def reduce_units(series, new_unit='-', min=0):
 	'''Replaces all units within a series with a set of smaller units
 
@@ -697,6 +946,7 @@ def main():
 
 __all__ = [
 	'Base',
+	'LRUCache',
 	'as_type',
 	'as_iterable',
 	'is_iterable',
@@ -708,6 +958,9 @@ __all__ = [
 	'try_',
 	'eval_',
 	'bool_test',
+	'vector_test',
+	'get_regex',
+	'REGEX_POOL',
 	'regex_match',
 	'regex_search',
 	'regex_sub',
@@ -730,6 +983,7 @@ __all__ = [
 	'list_to_lut',
 	'as_snakecase',
 	'nan_to_bottom',
+	'compact_series',
 	'reduce_units',
 	'get_xattr',
 	'set_xattr',
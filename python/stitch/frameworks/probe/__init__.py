@@ -1,3 +1,4 @@
 import stitch.frameworks.probe.backingstore
 import stitch.frameworks.probe.probe_api
 import stitch.frameworks.probe.probe_cli
+import stitch.frameworks.probe.wire
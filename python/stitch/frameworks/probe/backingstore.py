@@ -2,10 +2,12 @@ from __future__ import with_statement, print_function, absolute_import
 from itertools import *
 from functools import *
 import json
-from pandas import Series
+import pickle
+from pandas import DataFrame, Series
 from stitch.core.stitch_frame import StitchFrame
 from stitch.core.utils import *
 from stitch.core.errors import *
+from stitch.frameworks.probe import wire
 # ------------------------------------------------------------------------------
 
 '''
@@ -17,10 +19,28 @@ from stitch.core.errors import *
 '''
 
 class BackingStore(Base):
-	def __init__(self):
+	'''
+	Base class for interfacing data sources with the Probe API
+
+	Backingstores with a key can update incrementally, patching their
+	processed data with only the records that have been added, changed or
+	removed since the last update.  Data is typed by _finalize only once
+	patched, so that an incremental update yields the same frame as a full one.
+
+	Attributes:
+		key (list): Columns which uniquely identify a record.
+		incremental (bool): Patch data on update instead of rebuilding it.
+	'''
+	key = []
+
+	def __init__(self, incremental=False):
 		super(BackingStore, self).__init__()
 		self._data = None
 		self._results = None
+		self._incremental = incremental
+		self._fingerprints = {}
+		# processed, untyped data, kept for patching
+		self._raw = None
 
 	@property
 	def source_data(self):
@@ -34,28 +54,143 @@ class BackingStore(Base):
 	@property
 	def results(self):
 		return self._results
+
+	@property
+	def incremental(self):
+		return self._incremental
 	# --------------------------------------------------------------------------
 
-	def get_database(self):
+	def get_database(self, data_type=wire.JSON):
+		'''
+		Update and return data, along with its metadata
+
+		Args:
+			data_type (str, optional): Data type of returned data, member of
+				wire.DATA_TYPES.  JSON and columnar data can be passed across
+				process boundaries, whereas StitchFrame returns the data itself.
+				Default: JSON
+
+		Returns:
+			dict of metadata and data
+		'''
+		if data_type not in wire.DATA_TYPES:
+			raise TypeError('Unrecognized data type: ' + str(data_type))
+
 		self.update()
 		database = {}
 		database['metadata'] = {}
-		database['metadata']['data_type'] = 'json orient=records, DataFrame'
-		database['data'] = self._data.to_json(orient='records')
+		database['metadata']['data_type'] = data_type
+		database['data'] = wire.serialize(self._data, data_type)
 		return database
 
-	def update(self):
+	def _get_records(self):
+		# list of raw source records
+		return self.source_data
+
+	def _get_record_key(self, record):
+		return tuple(record[k] for k in self.key)
+
+	def _fingerprint(self, record):
+		# pickling is an order of magnitude cheaper than dumping json
+		try:
+			return hash(pickle.dumps(record, 2))
+		except (pickle.PicklingError, TypeError, AttributeError):
+			return hash(json.dumps(record, sort_keys=True, default=str))
+
+	def _diff_records(self, records):
+		'''
+		Semi-private method for finding source records which have changed since the last call
+
+		Args:
+			records (list): Raw source records.
+
+		Returns:
+			(records, removed, fingerprints) tuple of added or changed records,
+			the keys of removed records and the fingerprints of all records
+		'''
+		prints = {}
+		output = []
+		for record in records:
+			key = self._get_record_key(record)
+			prints[key] = self._fingerprint(record)
+			if self._fingerprints.get(key) != prints[key]:
+				output.append(record)
+		removed = [k for k in self._fingerprints if k not in prints]
+		return output, removed, prints
+
+	def _process(self, records):
+		# convert raw records into a DataFrame
 		data = []
-		for datum in self.source_data:
+		for datum in records:
 			data.append(Series(datum))
 		sdata = StitchFrame(data)
 		sdata.flatten()
 		sdata.coerce_nulls()
-		data = sdata._data
+		return sdata._data
+
+	def _finalize(self, data):
+		# type a copy of all processed data, whether patched or not
+		return StitchFrame(data).compact()._data
+
+	def get_delta(self):
+		'''
+		Fetch the records added, changed and removed since the last update
+
+		Returns:
+			dict of added, changed and removed keys, and processed data of the
+			added and changed records
+		'''
+		return self._get_delta()[0]
+
+	def _get_delta(self):
+		# delta and the fingerprints to be committed once it is applied
+		records, removed, prints = self._diff_records(self._get_records())
+		data = DataFrame(columns=self.key)
+		if len(records) > 0:
+			data = self._process(records)
+
+		keys = []
+		if len(data) > 0:
+			keys = list(zip(*[data[k].tolist() for k in self.key]))
+		current = set()
+		if self._raw is not None:
+			current = self._raw
+			current = set(zip(*[current[k].tolist() for k in self.key]))
+
+		delta = {}
+		delta['added'] = [k for k in keys if k not in current]
+		delta['changed'] = [k for k in keys if k in current]
+		delta['removed'] = removed
+		delta['data'] = data
+		return delta, prints
+
+	def update(self):
+		if self._incremental and self.key and self._raw is not None:
+			delta, prints = self._get_delta()
+			if len(delta['data']) > 0 or len(delta['removed']) > 0:
+				# patch copies on write, so frames handed out by get_database
+				# are never modified
+				raw = StitchFrame(self._raw)
+				raw.patch(delta['data'], self.key, removed=delta['removed'])
+				self._set_data(raw._data)
+			self._fingerprints = prints
+			return
+
+		records = self._get_records()
+		if self._incremental and self.key:
+			# fingerprint records, so that the next update can be incremental
+			records = list(records)
+			self._fingerprints = self._diff_records(records)[2]
+		data = self._process(records)
 		# data.dropna(how='all', axis=1, inplace=True)
+		self._set_data(data)
+
+	def _set_data(self, raw):
+		if self._incremental and self.key:
+			self._raw = raw
+		data = self._finalize(raw)
 		data['probe_id'] = data.index
-		sdata._data = data
-		self._data = sdata
+		self._data = StitchFrame(data)
 	# --------------------------------------------------------------------------
 
 	def _execute_instruction(self, instruction):
@@ -65,14 +200,11 @@ class BackingStore(Base):
 		getattr(self, func)(*args, **kwargs)
 
 	def process_order(self, order):
-		order = json.loads(order)
+		# orders from within the same process are not encoded
+		if not isinstance(order, dict):
+			order = wire.decode_message(order)
 		dtype = order['metadata']['data_type']
-		if dtype == u'json orient=records, DataFrame':
-			results = StitchFrame()
-			results.read_json(order['data'], orient='records')
-			self._results = results
-		else:
-			raise TypeError('Unrecognized data type: ' + dtype)
+		self._results = wire.deserialize(order['data'], dtype)
 
 		for instruction in order['instructions']:
 			self._execute_instruction(instruction)
@@ -3,10 +3,13 @@ from itertools import *
 from functools import *
 from collections import OrderedDict
 import json
+import time
+import threading
 from stitch.core.errors import *
 from stitch.core.utils import *
 from stitch.core.stitch_interpreter import StitchInterpreter
 from stitch.core.stitch_frame import StitchFrame
+from stitch.frameworks.probe import wire
 # ------------------------------------------------------------------------------
 
 '''
@@ -18,15 +21,39 @@ from stitch.core.stitch_frame import StitchFrame
 '''
 
 class ProbeAPI(Base):
-	def __init__(self, backingstore, updates='automatic'):
+	'''
+	API for querying and ordering a BackingStore
+
+	Update modes:
+		manual: database is only updated by calling update
+		automatic: database is updated on every access
+		cached: database is updated on access once it is older than max_age
+			seconds.  Concurrent callers share a single update.  If background
+			is True, the last database is served while a new one is built in a
+			background thread.
+
+	Data types:
+		The database, results and orders are exchanged as the given
+		data_type, a member of wire.DATA_TYPES.  JSON is the default.
+		StitchFrame avoids all serialization, and can be opted into unless the
+		backingstore lives in another process.
+	'''
+	def __init__(self, backingstore, updates='automatic', max_age=30, background=False,
+				 data_type=wire.JSON):
 		super(ProbeAPI, self).__init__()
 
-		if updates not in ['manual', 'automatic']:
-			raise NameError('Improper update mode supplied. Should be manual or automatic. Value provided: ' + updates)
+		if updates not in ['manual', 'automatic', 'cached']:
+			raise NameError('Improper update mode supplied. Should be manual, automatic or cached. Value provided: ' + updates)
 
 		self._backingstore = backingstore
+		self._data_type = data_type
 		self._updates = updates
+		self._max_age = max_age
+		self._background = background
 		self._database = None
+		self._updated = None
+		self._refresh = None
+		self._lock = threading.Lock()
 		self._results = None
 		self._interpreter = StitchInterpreter()
 		self._mongodb = None
@@ -36,8 +63,10 @@ class ProbeAPI(Base):
 
 	@property
 	def database(self):
-		if self._updates is 'automatic':
+		if self._updates == 'automatic':
 			self.update()
+		elif self._updates == 'cached':
+			self._cached_update()
 		return self._database
 
 	@property
@@ -54,10 +83,65 @@ class ProbeAPI(Base):
 
 	@property
 	def results(self):
-		return self._results
+		# results are kept as a StitchFrame, and returned as data_type
+		if self._results is None:
+			return None
+		return wire.serialize(self._results, self._data_type)
+
+	@property
+	def age(self):
+		'''Seconds since the database was last updated'''
+		if self._updated is None:
+			return None
+		return time.time() - self._updated
 
 	def update(self):
-		self._database = self._backingstore.get_database()
+		self._database = self._backingstore.get_database(data_type=self._data_type)
+		self._updated = time.time()
+
+	def _is_stale(self):
+		return self._updated is None or self.age >= self._max_age
+
+	def _cached_update(self):
+		'''
+		Semi-private method for updating a stale database, at most once at a time
+
+		The first caller to find the database stale performs the update, all
+		others wait for it to finish.  In background mode, callers only wait if
+		there is no database to serve yet.
+		'''
+		if not self._is_stale():
+			return
+
+		with self._lock:
+			if not self._is_stale():
+				return
+			refresh = self._refresh
+			leader = refresh is None
+			if leader:
+				refresh = threading.Event()
+				self._refresh = refresh
+
+		serve_stale = self._background and self._database is not None
+		if not leader:
+			if not serve_stale:
+				refresh.wait()
+			return
+
+		if serve_stale:
+			thread = threading.Thread(target=self._refresh_database, args=(refresh,))
+			thread.daemon = True
+			thread.start()
+		else:
+			self._refresh_database(refresh)
+
+	def _refresh_database(self, refresh):
+		try:
+			self.update()
+		finally:
+			with self._lock:
+				self._refresh = None
+			refresh.set()
 	# --------------------------------------------------------------------------
 
 	@property
@@ -69,29 +153,41 @@ class ProbeAPI(Base):
 
 	def automatic_updates(self):
 		self._updates = 'automatic'
+
+	def cached_updates(self, max_age=None, background=None):
+		self._updates = 'cached'
+		if max_age is not None:
+			self._max_age = max_age
+		if background is not None:
+			self._background = background
+
+	@property
+	def max_age(self):
+		return self._max_age
 	# --------------------------------------------------------------------------
 
 	def stitch_search(self, string, field_operator='==', display_fields=[]):
-		results = StitchFrame()
-		results.read_json(self.data)
-		results.stitch_search(string, field_operator=field_operator)
+		database = self.database
+		data_type = database['metadata']['data_type']
+		data = wire.deserialize(database['data'], data_type)
+		results = data.search(string, field_operator=field_operator, inplace=False)
 
-		if len(results.data) == 0:
+		if len(results._data) == 0:
 			raise NotFound('No search results found')
 
 		if display_fields:
 			results._data = results._data[display_fields]
 
-		results = results._data.to_json(orient='records')
 		self._results = results
 	# --------------------------------------------------------------------------
 
 	def send_order(self, instructions):
 		order = {}
-		order['data'] = self._results
-		order['metadata'] = self.metadata
+		order['data'] = wire.serialize(self._results, self._data_type)
+		order['metadata'] = {'data_type': self._data_type}
 		order['instructions'] = instructions
-		order = json.dumps(order)
+		if self._data_type != wire.STITCHFRAME:
+			order = wire.encode_message(order)
 
 		self._backingstore.process_order(order)
 # ------------------------------------------------------------------------------
@@ -5,6 +5,7 @@ import sys
 from cmd import Cmd
 from stitch.core.errors import *
 from stitch.frameworks.probe.probe_api import ProbeAPI
+from stitch.frameworks.probe import wire
 import pandas as pd
 pd.options.display.width = 500
 pd.options.display.max_rows = 1000
@@ -25,7 +26,7 @@ class ProbeCLI(Cmd):
 				 debug_mode=False, prompt='stitchql>'):
 		Cmd.__init__(self)
 		self.prompt = prompt
-		self._api = ProbeAPI(backingstore, updates=updates)
+		self._api = ProbeAPI(backingstore, updates=updates, data_type=wire.STITCHFRAME)
 		self._results = None
 		self._display_fields = display_fields
 		self._debug_mode = debug_mode
@@ -37,13 +38,13 @@ class ProbeCLI(Cmd):
 
 	def default(self, arg):
 		if self._debug_mode:
-			self._api.search(arg, display_fields=self._display_fields)
-			self._results = pd.read_json(self._api._results, orient='records')
+			self._api.stitch_search(arg, display_fields=self._display_fields)
+			self._results = self._api.results.to_dataframe()
 			print(self._results)
 		else:
 			try:
-				self._api.search(arg, display_fields=self._display_fields)
-				self._results = pd.read_json(self._api._results, orient='records')
+				self._api.stitch_search(arg, display_fields=self._display_fields)
+				self._results = self._api.results.to_dataframe()
 				print(self._results)
 			except NotFound:
 				print('No results found')
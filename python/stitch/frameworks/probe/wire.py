@@ -0,0 +1,244 @@
+from __future__ import with_statement, print_function, absolute_import
+from itertools import *
+from functools import *
+import json
+import struct
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from stitch.core.stitch_frame import StitchFrame
+# ------------------------------------------------------------------------------
+
+'''
+.. module:: wire
+	:platform: Unix
+	:synopsis: Data types for passing databases and orders between Probe components
+
+.. moduleauthor:: Alex Braun <alexander.g.braun@gmail.com>
+'''
+
+STITCHFRAME = 'StitchFrame'
+JSON = 'json orient=records, DataFrame'
+COLUMNAR = 'stitch columnar, DataFrame'
+DATA_TYPES = [STITCHFRAME, COLUMNAR, JSON]
+
+# columnar messages start with MAGIC, columnar buffers with a header length
+MAGIC = b'STCH'
+_LENGTH = struct.Struct('>I')
+# ------------------------------------------------------------------------------
+
+def _encode_values(values):
+	'''
+	Encode an array of values as a buffer
+
+	Returns:
+		(spec, buffer) tuple of a JSON serializable description and bytes
+	'''
+	if pd.api.types.is_categorical_dtype(values.dtype):
+		values = pd.Categorical(values)
+		spec, buffer = _encode_values(values.codes)
+		spec['kind'] = 'category'
+		spec['categories'] = values.categories.tolist()
+		return spec, buffer
+
+	values = np.asarray(values)
+	if values.dtype != object:
+		buffer = np.ascontiguousarray(values).tobytes()
+		return {'kind': 'numpy', 'dtype': values.dtype.str}, buffer
+
+	# object arrays of arbitrary python items
+	buffer = json.dumps(values.tolist(), default=str).encode('utf-8')
+	return {'kind': 'json'}, buffer
+
+def _decode_values(spec, buffer):
+	if spec['kind'] == 'category':
+		codes = np.frombuffer(buffer, dtype=np.dtype(spec['dtype']))
+		return pd.Categorical.from_codes(codes, spec['categories'])
+
+	if spec['kind'] == 'numpy':
+		return np.frombuffer(buffer, dtype=np.dtype(spec['dtype'])).copy()
+
+	values = json.loads(buffer.decode('utf-8'))
+	output = np.empty(len(values), dtype=object)
+	output[:] = values
+	return output
+
+def to_columnar(data):
+	'''
+	Encode a DataFrame as a columnar buffer
+
+	Numeric, boolean and datetime columns are stored as raw NumPy buffers,
+	categoricals as codes and categories, all other columns as JSON.
+
+	Args:
+		data (DataFrame or StitchFrame): Data to be encoded.
+
+	Returns:
+		bytes
+	'''
+	if isinstance(data, StitchFrame):
+		data = data.to_dataframe()
+
+	header = {'rows': len(data), 'columns': []}
+	buffers = []
+
+	index = data.index
+	if isinstance(index, pd.RangeIndex):
+		header['index'] = {'kind': 'range', 'start': int(index.start), 'step': int(index.step)}
+	else:
+		header['index'], buffer = _encode_values(index.values)
+		header['index']['size'] = len(buffer)
+		buffers.append(buffer)
+
+	for i, column in enumerate(data.columns):
+		spec, buffer = _encode_values(data.iloc[:, i].values)
+		spec['name'] = column
+		spec['size'] = len(buffer)
+		header['columns'].append(spec)
+		buffers.append(buffer)
+
+	header = json.dumps(header, default=str).encode('utf-8')
+	return b''.join([_LENGTH.pack(len(header)), header] + buffers)
+
+def from_columnar(buffer):
+	'''
+	Decode a columnar buffer into a DataFrame
+
+	Args:
+		buffer (bytes): Buffer created by to_columnar.
+
+	Returns:
+		DataFrame
+	'''
+	buffer = memoryview(buffer)
+	start = _LENGTH.size + _LENGTH.unpack(buffer[:_LENGTH.size].tobytes())[0]
+	header = json.loads(buffer[_LENGTH.size:start].tobytes().decode('utf-8'))
+
+	specs = header['columns']
+	index = header['index']
+	if index['kind'] != 'range':
+		specs = [index] + specs
+
+	values = []
+	for spec in specs:
+		stop = start + spec['size']
+		values.append(_decode_values(spec, buffer[start:stop].tobytes()))
+		start = stop
+
+	if index['kind'] == 'range':
+		stop = index['start'] + header['rows'] * index['step']
+		index = pd.RangeIndex(index['start'], stop, index['step'])
+	else:
+		index = values.pop(0)
+
+	data = DataFrame(dict(enumerate(values)), index=index, columns=range(len(values)))
+	data.columns = [x['name'] for x in header['columns']]
+	return data
+# ------------------------------------------------------------------------------
+
+def serialize(data, data_type=JSON):
+	'''
+	Serialize data according to a Probe data type
+
+	Args:
+		data (StitchFrame): Data to be serialized.
+		data_type (str, optional): Member of DATA_TYPES. Default: JSON
+
+	Returns:
+		StitchFrame, JSON string or columnar bytes
+	'''
+	if data_type == STITCHFRAME:
+		return data
+	if data_type == COLUMNAR:
+		return to_columnar(data)
+	if data_type == JSON:
+		return data.to_dataframe().to_json(orient='records', default_handler=str)
+	raise TypeError('Unrecognized data type: ' + str(data_type))
+
+def deserialize(data, data_type=JSON):
+	'''
+	Deserialize data according to a Probe data type
+
+	Args:
+		data (object): Data created by serialize.
+		data_type (str, optional): Member of DATA_TYPES. Default: JSON
+
+	Returns:
+		StitchFrame
+	'''
+	if data_type == STITCHFRAME:
+		return data
+	if data_type == COLUMNAR:
+		return StitchFrame(from_columnar(data))
+	if data_type == JSON:
+		return StitchFrame(pd.read_json(data, orient='records'))
+	raise TypeError('Unrecognized data type: ' + str(data_type))
+# ------------------------------------------------------------------------------
+
+def encode_message(message):
+	'''
+	Encode a database or order with serialized data, for sending to another process
+
+	Messages with columnar data are encoded as bytes: MAGIC, followed by the
+	length-prefixed JSON of every item but data, followed by data.  All other
+	messages are encoded as JSON.
+
+	Args:
+		message (dict): Database or order.
+
+	Returns:
+		bytes or str
+	'''
+	if message['metadata']['data_type'] != COLUMNAR:
+		return json.dumps(message)
+
+	header = dict((k, v) for k, v in message.items() if k != 'data')
+	header = json.dumps(header).encode('utf-8')
+	return b''.join([MAGIC, _LENGTH.pack(len(header)), header, message['data']])
+
+def decode_message(message):
+	'''
+	Decode a message created by encode_message
+
+	Args:
+		message (bytes or str): Encoded database or order.
+
+	Returns:
+		dict
+	'''
+	if isinstance(message, bytes) and message[:len(MAGIC)] == MAGIC:
+		start = len(MAGIC) + _LENGTH.size
+		stop = start + _LENGTH.unpack(message[len(MAGIC):start])[0]
+		output = json.loads(message[start:stop].decode('utf-8'))
+		output['data'] = message[stop:]
+		return output
+
+	if isinstance(message, bytes):
+		message = message.decode('utf-8')
+	return json.loads(message)
+# ------------------------------------------------------------------------------
+
+def main():
+	'''
+	Run help if called directly
+	'''
+
+	import __main__
+	help(__main__)
+
+__all__ = [
+	'STITCHFRAME',
+	'JSON',
+	'COLUMNAR',
+	'DATA_TYPES',
+	'MAGIC',
+	'to_columnar',
+	'from_columnar',
+	'serialize',
+	'deserialize',
+	'encode_message',
+	'decode_message'
+]
+
+if __name__ == '__main__':
+	main()
@@ -6,9 +6,11 @@ import warnings
 import os
 import json
 import imp
+import hashlib
 import pandas
 from stitch.core.utils import Base, interpret_nested_dict
 from stitch.frameworks.tune import config_path
+from stitch.core.errors import NotFound
 from stitch.core.stitch_lut import StitchLUT
 # ------------------------------------------------------------------------------
 
@@ -68,18 +70,8 @@ class Tuner(Base):
 					self._config[key] = value
 
 		luts = [x for x in all_files if os.path.splitext(x)[1] == '.lut']
-		master_luts = []
-		for lut in luts:
-			data = pandas.read_table(lut, delim_whitespace=True, index_col=False)
-			master_luts.append(data)
-
-		master_lut = None
-		if len(master_luts) > 0:
-			if len(master_luts) > 1:
-				master_lut = pandas.concat(master_luts, axis=1)
-			else:
-				master_lut = master_luts[0]
-			self._lut = StitchLUT(master_lut)
+		if len(luts) > 0:
+			self._lut = get_master_lut(luts, get_compiled_path(root))
 
 	def get_module(self, filepath):
 		module = os.path.basename(filepath)
@@ -89,8 +81,96 @@ class Tuner(Base):
 	def tune(self, items, lut_index):
 		input_lut = self._config[lut_index]['input_lut']
 		output_lut = self._config[lut_index]['output_lut']
-		return self._lut.transform_items(items, input_lut, output_lut)
+		return self._lut.transform(items, input_lut, output_lut)
 # ------------------------------------------------------------------------------
+
+COMPILED_LUT = '.master_lut'
+# directory of compiled LUTs, overridden by the STITCH_CACHE environment variable
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'stitch')
+
+def get_compiled_path(config):
+	'''
+	Fullpath of the compiled master LUT of a config directory
+
+	Compiled LUTs are written to a user cache directory, rather than the
+	config directory, which is often read-only or shared.  Each config
+	directory has its own compiled LUT.
+
+	Args:
+		config (str): Fullpath of config directory.
+
+	Returns:
+		str
+	'''
+	root = os.environ.get('STITCH_CACHE', CACHE_PATH)
+	name = hashlib.md5(os.path.abspath(config).encode('utf-8')).hexdigest()
+	return os.path.join(root, COMPILED_LUT + '_' + name)
+
+def get_checksum(filepaths):
+	'''
+	Checksum the names, sizes and modification times of the given files
+
+	Files are only stat'ed, not read, so that checking a compiled LUT is
+	cheap enough for every Tuner update.
+
+	Args:
+		filepaths (list): Fullpaths of files.
+
+	Returns:
+		str
+	'''
+	checksum = hashlib.md5()
+	for filepath in filepaths:
+		stat = os.stat(filepath)
+		item = [os.path.basename(filepath), stat.st_size, repr(stat.st_mtime)]
+		checksum.update(json.dumps(item).encode('utf-8'))
+	return checksum.hexdigest()
+
+def get_master_lut(filepaths, compiled=None):
+	'''
+	Create a StitchLUT from .lut files, concatenated in the order given
+
+	If compiled is given, the LUT is read from that compiled LUT, which is
+	written anew whenever the .lut files change.
+
+	Args:
+		filepaths (list): Fullpaths of .lut files.
+		compiled (str, optional): Fullpath of compiled LUT. Default: None.
+
+	Returns:
+		StitchLUT
+	'''
+	checksum = get_checksum(filepaths)
+	if compiled is not None:
+		lut = StitchLUT()
+		try:
+			lut.read_compiled(compiled, checksum=checksum)
+			return lut
+		except (IOError, OSError, ValueError, KeyError, NotFound):
+			pass
+
+	master_luts = []
+	for filepath in filepaths:
+		data = pandas.read_table(filepath, delim_whitespace=True, index_col=False)
+		master_luts.append(data)
+
+	if len(master_luts) > 1:
+		master_lut = pandas.concat(master_luts, axis=1)
+	else:
+		master_lut = master_luts[0]
+	lut = StitchLUT(master_lut)
+
+	if compiled is not None:
+		try:
+			root = os.path.dirname(compiled)
+			if root and not os.path.isdir(root):
+				os.makedirs(root)
+			lut.write_compiled(compiled, checksum=checksum)
+		except (IOError, OSError):
+			warnings.warn('Unable to write compiled LUT: ' + compiled, Warning)
+	return lut
+# ------------------------------------------------------------------------------
+
 def main():
 	'''
 	Run help if called directly
@@ -99,7 +179,8 @@ def main():
 	import __main__
 	help(__main__)
 
-__all__ = ['Tuner']
+__all__ = ['Tuner', 'COMPILED_LUT', 'CACHE_PATH', 'get_compiled_path', 'get_checksum',
+		   'get_master_lut']
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,348 @@
+from __future__ import with_statement, print_function, absolute_import
+from itertools import *
+from functools import *
+from itertools import cycle
+import os
+import shutil
+import tempfile
+import time
+import timeit
+import pandas as pd
+from pandas import Series
+from stitch.core.stitch_frame import StitchFrame
+from stitch.core.stitch_lut import StitchLUT
+from stitch.core.stitch_parser import _build_grammar
+from stitch.frameworks.probe import wire
+from stitch.frameworks.tune import tuner
+from stitch.test.utils import qb
+from stitch.test.utils import qube_utils
+from stitch.test.utils.qube_backingstore import QubeBackingStore
+from stitch.test.utils.renderlog_backingstore import RenderLogBackingStore
+# ------------------------------------------------------------------------------
+
+'''
+.. module:: benchmarks
+    :platform: Unix
+    :synopsis: Performance benchmarks
+
+.. moduleauthor:: Alex Braun <alexander.g.braun@gmail.com>
+'''
+
+def _report(name, **results):
+    print(name)
+    for key, value in sorted(results.items()):
+        print('    {:>24} : {}'.format(key, value))
+# ------------------------------------------------------------------------------
+
+def frame_init_001_benchmark(number=200):
+    # StitchFrames used to build their own stitchql grammar on construction
+    def per_frame():
+        # the baseline constructor, building a grammar for each instance
+        frame = StitchFrame()
+        frame._interpreter._grammar = _build_grammar()
+        return frame
+
+    StitchFrame()
+    baseline = timeit.timeit(per_frame, number=number) / number
+    frame = timeit.timeit(StitchFrame, number=number) / number
+    _report('StitchFrame() construction',
+        per_frame_grammar_sec=baseline,
+        shared_grammar_sec=frame,
+        speedup=baseline / frame
+    )
+# ------------------------------------------------------------------------------
+
+class _ScaledQube(object):
+    # stands in for the qb module, repeating its fixtures
+    def __init__(self, scale):
+        self._scale = scale
+
+    def setsupervisor(self, name):
+        pass
+
+    def jobinfo(self, *args, **kwargs):
+        return qb.jobinfo(*args, **kwargs) * self._scale
+
+def backingstore_compact_001_benchmark(scale=1000):
+    # job columns used to be left as object dtype and filled with ''
+    for scale_ in [1, scale]:
+        store = QubeBackingStore(jobinfo=True, database=_ScaledQube(scale_))
+        store.update()
+        after = store.data._data
+
+        # percentages were Decimals
+        before = after.copy()
+        for column in before.columns:
+            if before[column].dtype.name == 'category' or column.startswith('percent_'):
+                before[column] = before[column].astype(object).fillna('')
+
+        before = before.memory_usage(deep=True).sum()
+        after = after.memory_usage(deep=True).sum()
+        _report('Qube job memory, {} rows'.format(len(store.data._data)),
+            object_bytes=before,
+            compact_bytes=after,
+            ratio=before / float(after)
+        )
+# ------------------------------------------------------------------------------
+
+def probe_search_001_benchmark(scale=100, number=5):
+    # searches used to round trip the whole database through json
+    store = QubeBackingStore(jobinfo=True, database=_ScaledQube(scale))
+    store.update()
+    query = '(status) = (failed) | (priority) < (2000)'
+
+    def json_search():
+        data = store.data.to_dataframe().to_json(orient='records')
+        results = StitchFrame(pd.read_json(data, orient='records'))
+        results.search(query)
+        return results.to_dataframe().to_json(orient='records')
+
+    def frame_search():
+        return store.data.search(query, inplace=False)
+
+    json_ = timeit.timeit(json_search, number=number) / number
+    frame = timeit.timeit(frame_search, number=number) / number
+    _report('ProbeAPI search, {} rows'.format(len(store.data.to_dataframe())),
+        json_sec=json_,
+        stitchframe_sec=frame,
+        speedup=json_ / frame
+    )
+# ------------------------------------------------------------------------------
+
+def wire_format_001_benchmark(scale=100, number=5):
+    # databases and orders used to be exchanged as json only
+    store = QubeBackingStore(jobinfo=True, database=_ScaledQube(scale))
+    store.update()
+    for columns in ['all', 'scalar']:
+        data = store.data
+        if columns == 'scalar':
+            # without the nested agenda and subjob columns
+            data = StitchFrame(data.to_dataframe().drop(['agenda', 'subjobs'], axis=1))
+
+        results = {}
+        for data_type in [wire.JSON, wire.COLUMNAR]:
+            name = 'columnar' if data_type == wire.COLUMNAR else 'json'
+            payload = wire.serialize(data, data_type)
+            encode = timeit.timeit(lambda: wire.serialize(data, data_type), number=number)
+            decode = timeit.timeit(lambda: wire.deserialize(payload, data_type), number=number)
+            results[name + '_bytes'] = len(payload)
+            results[name + '_encode_sec'] = encode / number
+            results[name + '_decode_sec'] = decode / number
+        _report('Wire formats, {} rows, {} columns'.format(len(data.to_dataframe()), columns),
+            **results)
+# ------------------------------------------------------------------------------
+
+def renderlog_processes_001_benchmark(scale=60, processes=[2, 4]):
+    # log files used to be parsed one after another
+    fixtures = os.path.join(os.path.dirname(__file__), 'resources', 'qube_logs')
+    root = tempfile.mkdtemp()
+    try:
+        for i in range(scale):
+            shutil.copytree(fixtures, os.path.join(root, str(i).zfill(3)))
+        files = sum(len(x[2]) for x in os.walk(root))
+
+        results = {}
+        for processes_ in [None] + processes:
+            store = RenderLogBackingStore(path=root, processes=processes_)
+            name = 'processes_{}_sec'.format(processes_ or 0)
+            results[name] = timeit.timeit(store.update, number=1)
+        results['cpus'] = os.sysconf('SC_NPROCESSORS_ONLN')
+        _report('RenderLog parsing, {} files'.format(files), **results)
+    finally:
+        shutil.rmtree(root)
+# ------------------------------------------------------------------------------
+
+def renderlog_memory_map_001_benchmark(lines=1000000):
+    # large logs used to be read into memory line by line
+    filler = 'ALF_PROGRESS =  {}%\n'
+    error = 'Traceback (most recent call last):\n  File "render", line 1, in <module>\nIndexError: {}\n'
+    root = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(root, 'render.out')
+        with open(filepath, 'w') as log:
+            for i in range(lines):
+                log.write(error.format(i) if i % 10000 == 0 else filler.format(i % 100))
+
+        results = dict(megabytes=os.path.getsize(filepath) / 1e6)
+        for kwargs in [dict(), dict(stream=True), dict(memory_map=True)]:
+            store = RenderLogBackingStore(path=filepath, **kwargs)
+            name = (list(kwargs.keys()) or ['readlines'])[0]
+            results[name + '_sec'] = timeit.timeit(store.update, number=1)
+        _report('RenderLog scanning, {} lines'.format(lines), **results)
+    finally:
+        shutil.rmtree(root)
+# ------------------------------------------------------------------------------
+
+class _LatentQube(object):
+    # stands in for the qb module, with a round trip latency per stdout call
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def setsupervisor(self, name):
+        pass
+
+    def stdout(self, *subids):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [dict(data='ALF_PROGRESS = 50%\n// Warning: {}\n'.format(x)) for x in subids]
+
+def qube_stdout_001_benchmark(jobs=2000, latency=0.002):
+    # stdout used to be requested once per job
+    subids = Series([[str(i) + '.' + str(j) for j in range(3)] for i in range(jobs)])
+    results = {}
+    for name, size, threads in [('per_job', 3, 1), ('batched', 100, 4)]:
+        store = QubeBackingStore(jobinfo=True, stdout_batch_size=size, stdout_threads=threads,
+                                 database=_LatentQube(latency))
+        results[name + '_sec'] = timeit.timeit(lambda: store._get_stdout_data(subids), number=1)
+        results[name + '_calls'] = store._database.calls
+    _report('Qube stdout, {} jobs'.format(jobs), **results)
+# ------------------------------------------------------------------------------
+
+def qube_agenda_001_benchmark(scale=50):
+    # agenda stats used to be computed a job at a time
+    jobs = qb.jobinfo(agenda=True) * scale
+    agendas = [x['agenda'] for x in jobs]
+    ids = [x['id'] for x in jobs]
+    now = time.time()
+
+    def per_job():
+        return [qube_utils.get_agenda_stats(x, y, now=now) for x, y in zip(agendas, ids)]
+
+    def batch():
+        return qube_utils.get_batch_agenda_stats(agendas, ids, now=now)
+
+    per_job_ = timeit.timeit(per_job, number=1)
+    batch_ = timeit.timeit(batch, number=1)
+    _report('Qube agenda stats, {} jobs'.format(len(jobs)),
+        per_job_sec=per_job_,
+        batch_sec=batch_,
+        speedup=per_job_ / batch_
+    )
+# ------------------------------------------------------------------------------
+
+def qube_reservations_001_benchmark(jobs=100000):
+    # reservations used to be searched four times per job
+    items = Series([x['reservations'] for x in qb.jobinfo()])
+    items = items.sample(jobs, replace=True, random_state=0).reset_index(drop=True)
+
+    def per_job():
+        return [items.apply(func) for func in [qube_utils.get_procs,
+            qube_utils.get_plus_procs, qube_utils.get_ram, qube_utils.get_plus_ram]]
+
+    def single_pass():
+        return qube_utils.get_reservations(items)
+
+    per_job_ = timeit.timeit(per_job, number=1)
+    single_pass_ = timeit.timeit(single_pass, number=1)
+    _report('Qube reservations, {} jobs'.format(jobs),
+        per_job_sec=per_job_,
+        single_pass_sec=single_pass_,
+        speedup=per_job_ / single_pass_
+    )
+# ------------------------------------------------------------------------------
+
+def lut_make_numerical_001_benchmark(keys=2000, rows=20000):
+    # every item used to be found with a boolean scan of its keys column
+    data = pd.DataFrame({x: ['{}{}'.format(x, i % keys) for i in range(rows)] for x in 'abc'})
+    lut = StitchLUT(data)
+
+    def scan(item, column):
+        mask = lut.keys.to_dataframe()[column].apply(lambda x: x == item)
+        return lut.values.to_dataframe()[mask][column].tolist()[0]
+
+    sample = data.head(rows // 100)
+    scan_ = timeit.timeit(lambda: sample.apply(lambda x: x.apply(lambda y: scan(y, x.name))),
+        number=1) * 100
+    map_ = timeit.timeit(lambda: lut.make_numerical(data), number=1)
+    _report('StitchLUT make_numerical, {} keys, {} rows'.format(keys, rows),
+        scan_sec=scan_,
+        map_sec=map_,
+        speedup=scan_ / map_
+    )
+# ------------------------------------------------------------------------------
+
+def lut_generate_values_001_benchmark(rows=5000, columns=200):
+    # values used to be built by three applymap passes
+    data = pd.DataFrame([['{}'.format((i * j) % rows) for j in range(columns)]
+        for i in range(rows)])
+    lut = StitchLUT(data)
+    keys = lut.keys.to_dataframe()
+
+    def applymap():
+        mask = keys.applymap(lambda x: x == 'missing data')
+        values = cycle(range(1, len(keys) + 1))
+        values = keys.applymap(lambda x: next(values))
+        values[mask] = -1.0
+        return values.applymap(lambda x: float(x))
+
+    results = dict(applymap_sec=timeit.timeit(applymap, number=1))
+    for dtype in ['float64', 'float32', 'int32']:
+        results[dtype + '_sec'] = timeit.timeit(lambda: lut.generate_values(dtype=dtype),
+            number=1)
+        results[dtype + '_bytes'] = lut.values.to_dataframe().memory_usage().sum()
+
+    # lookup dictionaries are built on first use of each column
+    def build_maps():
+        lut._reset_maps()
+        for column in keys.columns:
+            lut._get_maps(column)
+
+    results['build_maps_sec'] = timeit.timeit(build_maps, number=1)
+    _report('StitchLUT generate_values, {} x {} keys'.format(rows, columns), **results)
+# ------------------------------------------------------------------------------
+
+def lut_transform_001_benchmark(names=30, scale=100000):
+    # items used to be transformed one at a time, by forward and reverse lookups
+    lut = os.path.join(os.path.dirname(__file__), '..', 'frameworks', 'tune', 'config', 'qube.lut')
+    lut = StitchLUT(pd.read_table(lut, delim_whitespace=True, index_col=False))
+    source, target = 'QUBE_MASTER_LUT', 'QUBE_SHORT_NAME_LUT'
+    items = lut.keys.to_dataframe()[source].tolist()[:names] * scale
+
+    def per_item():
+        return [lut.reverse_lookup_item(lut.lookup_item(x, source), target) for x in items]
+
+    per_item_ = timeit.timeit(per_item, number=1)
+    batch = timeit.timeit(lambda: lut.transform(items, source, target), number=1)
+    series = Series(items)
+    batch_series = timeit.timeit(lambda: lut.transform(series, source, target), number=1)
+    _report('StitchLUT transform, {} items'.format(len(items)),
+        per_item_sec=per_item_,
+        batch_list_sec=batch,
+        batch_series_sec=batch_series,
+        speedup=per_item_ / batch
+    )
+# ------------------------------------------------------------------------------
+
+def lut_compiled_001_benchmark(number=20):
+    # the master LUT used to be read and built from its .lut files by every Tuner
+    config = os.path.join(os.path.dirname(__file__), '..', 'frameworks', 'tune', 'config')
+    root = tempfile.mkdtemp()
+    try:
+        luts = []
+        for name in sorted(os.listdir(config)):
+            if name.endswith('.lut'):
+                shutil.copy(os.path.join(config, name), root)
+                luts.append(os.path.join(root, name))
+        compiled = os.path.join(root, tuner.COMPILED_LUT)
+        tuner.get_master_lut(luts, compiled)
+
+        build = timeit.timeit(lambda: tuner.get_master_lut(luts), number=number) / number
+        load = timeit.timeit(lambda: tuner.get_master_lut(luts, compiled), number=number) / number
+        _report('Tuner master LUT, {} files'.format(len(luts)),
+            build_sec=build,
+            compiled_sec=load,
+            speedup=build / load
+        )
+    finally:
+        shutil.rmtree(root)
+# ------------------------------------------------------------------------------
+
+def main():
+    for name, func in sorted(globals().items()):
+        if name.endswith('_benchmark'):
+            func()
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,31 @@ from __future__ import with_statement, print_function, absolute_import
 from itertools import *
 from functools import *
 import os
+import json
+import shutil
+import tempfile
+import time
+import threading
+import numpy as np
+from pandas import DataFrame, Series
 from stitch.core.stitch_frame import StitchFrame
 from stitch.core.stitch_string import StitchString
+from stitch.core.stitch_interpreter import StitchInterpreter, PLAN_CACHE
+from stitch.core.stitch_lut import StitchLUT
+from stitch.core import utils
+from stitch.frameworks.probe.backingstore import BackingStore
+from stitch.frameworks.probe.probe_api import ProbeAPI
+from stitch.frameworks.probe import wire
+from stitch.frameworks.tune import tuner
+from stitch.test.utils.renderlog_backingstore import RenderLogBackingStore
+from stitch.test.utils import renderlog_utils
+from stitch.test.utils.qube_backingstore import QubeBackingStore
+from stitch.test.utils import qb
+from stitch.test.utils import qube_utils
 # ------------------------------------------------------------------------------
 
 _YAML = os.path.abspath('./resources/stitch_string.yml')
+_LOGS = os.path.abspath('./resources/qube_logs')
 _JSON = dict(
     a1=dict(
         b1=dict(
@@ -45,6 +65,26 @@ _DATA = [
     [4,5,6],
     [7,8,9]
 ]
+
+_JOBS = DataFrame([
+    ['vfx_hyperion_nuke_shot01', 5,    'running',  0.12, 'a'],
+    ['vfx_chronos_vray_shot01',  110,  'failed',   4.5,  1],
+    ['design_temple_shot56',     2500, 'running',  None, 2.5],
+    ['vfx_atlas_nuke_shot22',    2501, 'failed',   0.83, None],
+    ['vfx_eos_houdini_lm01',     3000, None,       1.0,  'b']
+], columns=['name', 'pri', 'status', 'max', 'misc'])
+
+_QUERIES = [
+    '(pri) <= (2500) & (status) = (failed)',
+    '(name) ~ (nuke) | (max) >= (4)',
+    '(name) notcont (nuke, vray)',
+    '(name) ~~ (Nuke)',
+    '(status) != (failed)',
+    '(misc) = (a, 1)',
+    '(misc) ~ (b)',
+    '(pri, max) > (100)',
+    '(name) = (5)'
+]
 # ------------------------------------------------------------------------------
 
 def frame_applymap_001_test():
@@ -66,6 +106,616 @@ def frame_flatten_001_test():
         [[1, 2, 3], [4, 5, 6], [7, 8, 9]], 'b3']
     )
 
+def interpreter_engine_001_test():
+    for query in _QUERIES:
+        results = []
+        for engine in ['cell', 'vector']:
+            interpreter = StitchInterpreter(engine=engine)
+            interpreter.search(query)
+            data = interpreter.dataframe_query(_JOBS)
+            results.append(sorted(data.index.tolist()))
+        assert(results[0] == results[1])
+
+def interpreter_engine_002_test():
+    # the vector engine returns rows in the order of the cell engine
+    jobs = _JOBS.iloc[[3, 0, 4, 1, 2]]
+    queries = _QUERIES + ['(status) = (failed) | (name) ~ (hyperion) | (misc) = (b)']
+    for query in queries:
+        interpreter = StitchInterpreter(engine='cell')
+        interpreter.search(query)
+        expected = interpreter.dataframe_query(jobs).index.tolist()
+        for or_mode in ['narrow', 'shared']:
+            interpreter = StitchInterpreter(or_mode=or_mode)
+            interpreter.search(query)
+            assert(interpreter.dataframe_query(jobs).index.tolist() == expected)
+
+def interpreter_or_mode_001_test():
+    query = '(pri) <= (2500) & (status) = (failed) | (pri) <= (2500) & (max) >= (4) | (name) ~ (houdini)'
+    results = []
+    for or_mode in ['narrow', 'shared']:
+        interpreter = StitchInterpreter(or_mode=or_mode)
+        interpreter.search(query)
+        data = interpreter.dataframe_query(_JOBS)
+        results.append(data.index.tolist())
+    assert(results[0] == results[1] == [1, 4])
+
+def interpreter_plan_cache_001_test():
+    PLAN_CACHE.clear()
+    query = '(pri) <= (2500) & (status) = (failed)'
+    for i in range(3):
+        data = StitchFrame(_JOBS.copy())
+        data.search(query)
+    assert(PLAN_CACHE.stats['misses'] == 1)
+    assert(PLAN_CACHE.stats['hits'] == 2)
+    assert(data.to_dataframe().index.tolist() == [1])
+
+    # a different schema compiles a new plan
+    StitchFrame(_JOBS[['pri', 'status']].copy()).search(query)
+    assert(PLAN_CACHE.stats['misses'] == 2)
+
+def interpreter_planner_001_test():
+    interpreter = StitchInterpreter()
+    interpreter.search('(name) ~ (nuke) & (pri) <= (2500) & (pri) > (2600)')
+    plan = interpreter._compile(_JOBS)
+    queries = interpreter._plan_compound(_JOBS, plan['queries'][0], {})
+    assert([q['operator'] for q in queries] == ['>', '<=', 're.IGNORECASE'])
+    assert(len(interpreter._execute(_JOBS, plan)) == 0)
+
+def frame_index_001_test():
+    data = StitchFrame(_JOBS.copy())
+    data.create_index('status').create_index('pri', kind='sorted')
+    indexes = data.update_indexes()
+    assert(sorted(indexes.keys()) == ['pri', 'status'])
+    assert(indexes['pri'].lookup('<=', [110]).tolist() == [True, True, False, False, False])
+    assert(indexes['status'].lookup('!=', ['failed']).tolist() == [True, False, True, False, True])
+
+    # replacing the internal DataFrame invalidates built indexes
+    data.applymap(lambda x: x, columns=['name'])
+    assert(data._built_indexes[1] == {})
+
+    data.search('(pri) <= (2500) & (status) = (failed)')
+    assert(data.to_dataframe().index.tolist() == [1])
+
+    # as are indexes of columns edited in place
+    data = StitchFrame(_JOBS.copy())
+    data.create_index('status').create_index('pri', kind='sorted')
+    data.update_indexes()
+    data._data.loc[0, 'status'] = 'failed'
+    data._data['pri'] = [5, 110, 2500, 2501, 30]
+    result = data.search('(pri) <= (2500) & (status) = (failed)', inplace=False)
+    assert(result.to_dataframe().index.tolist() == [0, 1])
+
+def frame_compact_001_test():
+    data = _JOBS.copy().astype(object)
+    data = DataFrame([data.iloc[i % 5] for i in range(20)]).reset_index(drop=True)
+    source = StitchFrame(data)
+    data = source.compact()
+    dtypes = data.to_dataframe().dtypes.apply(lambda x: x.name).to_dict()
+    assert(dtypes == {'name': 'category', 'pri': 'int64', 'status': 'category',
+                      'max': 'float64', 'misc': 'object'})
+    # compacted data is a copy
+    assert((source.to_dataframe().dtypes == object).all())
+
+    data.search('(status) = (failed) & (pri) > (200) | (name) ~ (houdini)')
+    assert(data.to_dataframe().index.tolist() == [3, 4, 8, 9, 13, 14, 18, 19])
+
+class _RecordStore(BackingStore):
+    key = ['id']
+
+    def __init__(self, records, incremental=True):
+        super(_RecordStore, self).__init__(incremental=incremental)
+        self.records = records
+        self.processed = 0
+
+    @property
+    def source_data(self):
+        return [dict(x) for x in self.records]
+
+    def _process(self, records):
+        self.processed += len(records)
+        return super(_RecordStore, self)._process(records)
+
+def backingstore_incremental_001_test():
+    records = [dict(id=i, status='queued', pri=i * 10, host='h' + str(i)) for i in range(6)]
+    store = _RecordStore(records)
+    store.update()
+    assert(store.processed == 6)
+    snapshot = store.get_database(data_type=wire.STITCHFRAME)['data']
+
+    records[2]['status'] = 'running'
+    # no changed record carries host
+    del records[2]['host']
+    records.pop(4)
+    records.append(dict(id=9, status='queued', pri=90))
+    store.update()
+    assert(store.processed == 8)
+
+    # frames already handed out are left untouched
+    assert(store.data is not snapshot)
+    assert(snapshot.to_dataframe()['id'].tolist() == list(range(6)))
+    assert(snapshot.to_dataframe()['status'].tolist() == ['queued'] * 6)
+
+    full = _RecordStore(records, incremental=False)
+    full.update()
+    data = store.data.to_dataframe()
+    assert(data['id'].tolist() == [0, 1, 2, 3, 5, 9])
+    expected = full.data.to_dataframe().drop('probe_id', axis=1)
+    result = data[expected.columns].reset_index(drop=True)
+    assert(result.equals(expected))
+    assert(result.dtypes.tolist() == expected.dtypes.tolist())
+    assert(data['status'].dtype.name == 'category')
+    assert(data['host'].tolist()[2] != data['host'].tolist()[2])
+    assert(data['probe_id'].tolist() == [0, 1, 2, 3, 5, 6])
+
+    records[0]['pri'] = 5
+    records.pop(1)
+    delta = store.get_delta()
+    assert(delta['changed'] == [(0,)])
+    assert(delta['added'] == [])
+    assert(delta['removed'] == [(1,)])
+
+    # removals alone still patch the data
+    records.pop(0)
+    store.update()
+    assert(store.data.to_dataframe()['id'].tolist() == [2, 3, 5, 9])
+    assert(store.get_delta()['removed'] == [])
+
+class _SlowStore(BackingStore):
+    def __init__(self, delay=0.1):
+        super(_SlowStore, self).__init__()
+        self.delay = delay
+        self.calls = 0
+
+    def get_database(self, data_type=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        return {'metadata': {}, 'data': self.calls}
+
+def probe_api_cached_001_test():
+    store = _SlowStore()
+    api = ProbeAPI(store, updates='cached', max_age=60)
+    threads = [threading.Thread(target=lambda: api.data) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert(store.calls == 1)
+    assert(api.data == 1)
+
+    # stale databases are rebuilt on access
+    api.cached_updates(max_age=0)
+    assert(api.data == 2)
+
+    # background refreshes serve the last database until the new one is built
+    api.cached_updates(background=True)
+    assert(api.data == 2)
+    time.sleep(store.delay * 3)
+    assert(store.calls == 3)
+    assert(api._database['data'] == 3)
+
+def probe_api_search_001_test():
+    class Store(_RecordStore):
+        def set_status(self, status):
+            self.ordered = self.results.to_dataframe()['id'].tolist()
+
+    records = [dict(id=i, status='queued', pri=i * 10) for i in range(6)]
+    store = Store(records)
+    api = ProbeAPI(store, data_type=wire.STITCHFRAME)
+    api.stitch_search('(pri) >= (30)', display_fields=['id', 'pri'])
+    assert(api.data_type == 'StitchFrame')
+    assert(api.results.to_dataframe().columns.tolist() == ['id', 'pri'])
+
+    # searches do not modify the backingstore's data
+    assert(len(store.data.to_dataframe()) == 6)
+
+    api.send_order([dict(func='set_status', args=['done'], kwargs={})])
+    assert(store.ordered == [3, 4, 5])
+
+    # serialized orders are still accepted
+    order = dict(
+        data=api.results.to_dataframe().to_json(orient='records'),
+        metadata=store.get_database()['metadata'],
+        instructions=[dict(func='set_status', args=['done'], kwargs={})]
+    )
+    store.process_order(json.dumps(order))
+    assert(store.ordered == [3, 4, 5])
+
+    # results are JSON by default
+    api = ProbeAPI(store)
+    api.stitch_search('(pri) >= (30)', display_fields=['id', 'pri'])
+    assert(api.data_type == wire.JSON)
+    assert(json.loads(api.results) == [dict(id=3, pri=30), dict(id=4, pri=40), dict(id=5, pri=50)])
+
+    # columnar orders are accepted too
+    store.ordered = None
+    api = ProbeAPI(store, data_type=wire.COLUMNAR)
+    api.stitch_search('(status) = (queued) & (pri) < (20)')
+    api.send_order([dict(func='set_status', args=['done'], kwargs={})])
+    assert(api.data_type == wire.COLUMNAR)
+    assert(store.ordered == [0, 1])
+
+def wire_columnar_001_test():
+    data = _JOBS.copy()
+    data['status'] = data['status'].astype('category')
+    data = data.iloc[[4, 0, 2]]
+    result = wire.from_columnar(wire.to_columnar(data))
+    assert(result.equals(data))
+    assert(result.dtypes.tolist() == data.dtypes.tolist())
+
+    message = dict(metadata=dict(data_type=wire.COLUMNAR), data=wire.to_columnar(data))
+    message = wire.encode_message(message)
+    assert(message.startswith(wire.MAGIC))
+    result = wire.from_columnar(wire.decode_message(message)['data'])
+    assert(result.equals(data))
+
+def utils_regex_001_test():
+    pattern = utils.get_regex(['nuke', 'maya'], ignore_case=True)
+    assert(pattern is utils.get_regex(['nuke', 'maya'], ignore_case=True))
+    assert(pattern.search('NUKE') is not None)
+    assert(isinstance(utils.get_regex(['(nu)ke', 'maya']), list))
+
+    # negated clauses match rows missing any one of the values
+    mask = utils.vector_test(_JOBS['name'], 'nre.IGNORECASE', ['nuke', 'v001'])
+    expected = _JOBS['name'].apply(lambda x: 'nuke' not in x or 'v001' not in x)
+    assert(mask.tolist() == expected.tolist())
+
+def renderlog_stream_001_test():
+    store = RenderLogBackingStore(path=_LOGS)
+    store.update()
+    expected = store.data.to_dataframe()
+
+    # small chunks split lines across chunk boundaries
+    for chunk_size in [16, 1024]:
+        store = RenderLogBackingStore(path=_LOGS, stream=True, chunk_size=chunk_size)
+        store.update()
+        assert(store.data.to_dataframe().equals(expected))
+
+def renderlog_processes_001_test():
+    store = RenderLogBackingStore(path=_LOGS)
+    store.update()
+    expected = store.data.to_dataframe()
+
+    for stream in [False, True]:
+        store = RenderLogBackingStore(path=_LOGS, stream=stream, processes=2)
+        store.update()
+        assert(store.data.to_dataframe().equals(expected))
+
+def renderlog_memory_map_001_test():
+    store = RenderLogBackingStore(path=_LOGS)
+    store.update()
+    expected = store.data.to_dataframe()
+
+    store = RenderLogBackingStore(path=_LOGS, memory_map=True)
+    store.update()
+    data = store.data.to_dataframe()
+    assert(data.drop('raw_data', axis=1).equals(expected))
+    refs = data['raw_data'].tolist()
+    assert(all(isinstance(x, renderlog_utils.LineReference) for x in refs))
+    assert(any(str(x).endswith(y) for x, y in zip(refs, data['error']) if y))
+
+    filepath = os.path.join(_LOGS, '123202_0.out')
+    with open(filepath, 'rb') as log:
+        text = log.read()
+    offset = text.index(b'NameError')
+    ref = renderlog_utils.LineReference(filepath, offset, text.index(b'\n', offset) - offset)
+    assert(str(ref) == "NameError: global name 'RE' is not defined")
+
+def renderlog_crlf_001_test():
+    # CRLF copies of the fixtures yield the same frames in every mode
+    root = tempfile.mkdtemp()
+    for name in ['123202_0.out', '124015_1.out']:
+        with open(os.path.join(_LOGS, name), 'rb') as log:
+            text = log.read()
+        with open(os.path.join(root, name), 'wb') as log:
+            log.write(text.replace(b'\n', b'\r\n'))
+
+    try:
+        store = RenderLogBackingStore(path=root)
+        store.update()
+        expected = store.data.to_dataframe()
+        assert(not expected['error'].str.endswith('\r').any())
+
+        modes = [dict(stream=True, chunk_size=16), dict(memory_map=True), dict(follow=True)]
+        for mode in modes:
+            store = RenderLogBackingStore(path=root, **mode)
+            store.update()
+            data = store.data.to_dataframe()
+            if 'raw_data' in data.columns:
+                assert(not any(str(x).endswith('\r') for x in data['raw_data']))
+                data = data.drop('raw_data', axis=1)
+            assert(data.equals(expected))
+    finally:
+        shutil.rmtree(root)
+
+def renderlog_follow_001_test():
+    with open(os.path.join(_LOGS, '123202_0.out'), 'r') as log:
+        text = log.read()
+    root = tempfile.mkdtemp()
+    filepath = os.path.join(root, 'render.out')
+    checkpoint = os.path.join(root, 'checkpoint.json')
+
+    def expected():
+        store = RenderLogBackingStore(path=filepath)
+        store.update()
+        return store.data.to_dataframe()
+
+    try:
+        store = RenderLogBackingStore(path=filepath, follow=True, checkpoint=checkpoint)
+        # appends split lines, which are parsed once complete
+        for i in range(1000, len(text) + 1000, 1000):
+            with open(filepath, 'w') as log:
+                log.write(text[:i])
+            store.update()
+            assert(store.data.to_dataframe().equals(expected()))
+
+        resumed = RenderLogBackingStore(path=filepath, follow=True, checkpoint=checkpoint)
+        # the incomplete last line is not consumed
+        assert(resumed._follow_states[filepath]['offset'] == text.rindex('\n') + 1)
+        resumed.update()
+        assert(resumed.data.to_dataframe().equals(expected()))
+
+        # truncation
+        with open(filepath, 'w') as log:
+            log.write('// Warning: truncated\nALF_PROGRESS = 5%\n')
+        store.update()
+        assert(store.data.to_dataframe().equals(expected()))
+        assert(store.data.to_dataframe()['warning'].tolist() == ['truncated', ''])
+    finally:
+        shutil.rmtree(root)
+
+def renderlog_follow_002_test():
+    with open(os.path.join(_LOGS, '123202_0.out'), 'r') as log:
+        text = log.read()
+    root = tempfile.mkdtemp()
+    filepaths = [os.path.join(root, x) for x in ['a.out', 'b.out']]
+
+    def expected():
+        store = RenderLogBackingStore(path=root)
+        store.update()
+        return store.data.to_dataframe()
+
+    try:
+        for filepath in filepaths:
+            with open(filepath, 'w') as log:
+                log.write(text[:2000])
+        store = RenderLogBackingStore(path=root, follow=True, incremental=True)
+        store.update()
+        offset = store._follow_states[filepaths[1]]['offset']
+
+        # unchanged logs keep their follow state across incremental updates
+        with open(filepaths[0], 'w') as log:
+            log.write(text)
+        store.update()
+        assert(store._follow_states[filepaths[1]]['offset'] == offset)
+
+        with open(filepaths[1], 'w') as log:
+            log.write(text)
+        store.update()
+        assert(store._follow_states[filepaths[1]]['offset'] == text.rindex('\n') + 1)
+        columns = ['filename', 'line', 'warning', 'error']
+        rows = lambda x: sorted(map(tuple, x[columns].astype(str).values.tolist()))
+        assert(rows(store.data.to_dataframe()) == rows(expected()))
+
+        # removed logs lose theirs
+        os.remove(filepaths[0])
+        store.update()
+        assert(list(store._follow_states.keys()) == [filepaths[1]])
+    finally:
+        shutil.rmtree(root)
+
+def renderlog_classify_001_test():
+    lines = []
+    for root, dirs, files in os.walk(_LOGS):
+        for f in files:
+            with open(os.path.join(root, f), 'r') as log:
+                lines.extend(log.read().split('\n'))
+
+    data = renderlog_utils.classify_lines(lines)
+    expected = DataFrame(dict(
+        warning=[renderlog_utils.get_warnings(x, logtype='mental ray') for x in lines],
+        error=[renderlog_utils.get_errors(x) for x in lines],
+        progress=[renderlog_utils.get_progress(x, logtype='alfred') for x in lines],
+        traceback=[renderlog_utils.get_tracebacks(x) for x in lines],
+        traceback_line=[renderlog_utils.get_traceback_line(x) for x in lines],
+        traceback_file=[renderlog_utils.get_traceback_file(x) for x in lines]
+    ), columns=data.columns)
+    assert(data.equals(expected))
+    assert(data.notnull().any().all())
+
+class _StdoutQube(object):
+    # stands in for the qb module, serving stdout from the log fixtures
+    def __init__(self):
+        self.calls = 0
+
+    def setsupervisor(self, name):
+        pass
+
+    def stdout(self, *subids):
+        self.calls += 1
+        output = []
+        for subid in subids:
+            filepath = os.path.join(_LOGS, subid.replace('.', '_') + '.out')
+            with open(filepath, 'r') as log:
+                output.append(dict(data=log.read()))
+        return output
+
+def qube_stdout_001_test():
+    store = QubeBackingStore(jobinfo=True, stdout_batch_size=4, stdout_threads=2,
+                             database=_StdoutQube())
+    subids = Series([
+        ['123202.0', '123202.1', '123202.2'],
+        ['123999.1'],
+        ['123100.0'],
+        ['124015.2', '123097.0', '123097.1']
+    ] * 2)
+    texts = store._get_stdout_data(subids)
+    assert(store._database.calls == 4)
+    assert(texts.isnull().tolist() == [False, False, True, False] * 2)
+
+    stats = store._get_stdout_stats(texts)
+    for text, result in zip(texts, stats):
+        expected = {'progress': float('nan'), 'warning': float('nan'), 'error': float('nan')}
+        if isinstance(text, str):
+            log = RenderLogBackingStore(text=text)
+            log.update()
+            data = log.data.to_dataframe()
+            for key in expected.keys():
+                expected[key] = ' '.join(data[key].unique().tolist())
+        assert(str(result) == str(expected))
+
+class _CountingQube(object):
+    # stands in for the qb module, recording jobinfo queries
+    def __init__(self):
+        self.queries = []
+
+    def setsupervisor(self, name):
+        pass
+
+    def jobinfo(self, filters={}, **kwargs):
+        self.queries.append(filters)
+        jobs = qb.jobinfo(**kwargs)
+        if filters:
+            jobs = [x for x in jobs if x['pgrp'] == filters['pgrp']]
+        return jobs
+
+def qube_callbacks_001_test():
+    database = _CountingQube()
+    store = QubeBackingStore(jobinfo=True, callbacks=True, database=database)
+    store.update()
+    data = store.data.to_dataframe().set_index('id')
+
+    # one query per process group with triggers, rather than per job
+    pgrps = [x['pgrp'] for x in database.queries[1:]]
+    assert(sorted(pgrps) == [123000, 123012, 123030, 123096, 123100, 123202, 123999])
+    assert(data.loc[123002, 'dependency'] == [123000])
+    assert(data.loc[123205, 'dependency'] == [123202, 123204])
+    assert(data.loc[124012, 'dependency'] == ['bad_data'])
+    assert(data.loc[123066, 'dependency'] == [123066])
+
+def qube_incremental_001_test():
+    store = QubeBackingStore(jobinfo=True, agenda=True, incremental=True)
+    # records share their agendas with the qb fixtures
+    records = json.loads(json.dumps(store._get_records()))
+    for frame in records[0]['agenda']:
+        frame['status'] = 'complete'
+    store._fingerprints = store._diff_records(records)[2]
+
+    # unchanged jobs with running frames are processed again
+    changed = store._diff_records(records)[0]
+    expected = [x['id'] for x in records[1:]
+        if any(y['status'] == 'running' for y in x['agenda'])]
+    assert(len(expected) > 0)
+    assert([x['id'] for x in changed] == expected)
+
+def qube_agenda_001_test():
+    jobs = qb.jobinfo(agenda=True)
+    now = time.time()
+    for embed_graphs in [False, True]:
+        results = qube_utils.get_batch_agenda_stats([x['agenda'] for x in jobs],
+            [x['id'] for x in jobs], embed_graphs=embed_graphs, now=now)
+        for job, result in zip(jobs, results):
+            expected = qube_utils.get_agenda_stats(job['agenda'], job['id'],
+                embed_graphs=embed_graphs, now=now)
+            assert(sorted(result.keys()) == sorted(expected.keys()))
+            for key, value in expected.items():
+                if key.startswith('frame_graph'):
+                    assert(DataFrame(result[key]).equals(DataFrame(value)))
+                elif value == value:
+                    assert(result[key] == value)
+                else:
+                    assert(result[key] != result[key])
+
+def qube_reservations_001_test():
+    items = Series([x['reservations'] for x in qb.jobinfo()] +
+        ['host.processors=2+,host.memory=100', '', 'host.processors=3/8'])
+    results = qube_utils.get_reservations(items)
+    for i, item in items.items():
+        expected = [qube_utils.get_procs(item), qube_utils.get_plus_procs(item),
+            qube_utils.get_ram(item), qube_utils.get_plus_ram(item)]
+        result = results.loc[i, ['procs', 'procs+', 'ram', 'ram+']].tolist()
+        assert([x if x == x else '' for x in result] == expected)
+    assert(results['procs'].dtype.kind in 'if')
+
+    results = qube_utils.get_batch_slots(items)
+    for i, item in items.items():
+        expected = qube_utils.get_slots(item)
+        result = results.loc[i].tolist()
+        assert([x if x == x else None for x in result] == [expected['used'], expected['total']])
+
+def lut_lookup_001_test():
+    data = DataFrame({'a': ['x', 'y', None, 'x'], 'b': ['p', 'q', 'r', 's']})
+    lut = StitchLUT(data)
+    keys = lut.keys.to_dataframe()
+    values = lut.values.to_dataframe()
+    for column in keys.columns:
+        for key, value in zip(keys[column], values[column]):
+            expected = values[column][keys[column] == key].tolist()[0]
+            assert(lut.lookup_item(key, column) == expected)
+            assert(lut.reverse_lookup_item(expected, column) == key)
+    assert(lut.lookup_item('z', 'a') != lut.lookup_item('z', 'a'))
+
+    result = lut.make_numerical(data)
+    expected = data.apply(lambda x: x.apply(lambda y: lut.lookup_item(y, x.name)))
+    assert(result.equals(expected))
+
+def lut_values_001_test():
+    data = DataFrame({'a': ['x', 'y', None], 'b': ['p', 'q', 'r']})
+    for dtype in [np.float64, np.float32, np.int32]:
+        lut = StitchLUT(data, dtype=dtype)
+        values = lut.values.to_dataframe()
+        assert(values.dtypes.tolist() == [np.dtype(dtype)] * 2)
+        assert(values.values.tolist() == [[1, 1], [2, 2], [-1, 3]])
+
+        lut.generate_values(start=0, step=2)
+        values = lut.values.to_dataframe()
+        assert(values.values.tolist() == [[0, 2], [2, 0], [-1, 2]])
+        assert(lut.lookup_item('y', 'a') == 2)
+
+def lut_transform_001_test():
+    data = DataFrame({'a': ['x', 'y', 'z'], 'b': ['p', None, 'r']})
+    lut = StitchLUT(data)
+    items = ['y', 'x', 'w']
+    expected = ['r', 'p', 'w']
+    assert(lut.transform(items, 'a', 'b') == expected)
+    assert(lut.transform(Series(items), 'a', 'b').tolist() == expected)
+    assert(lut.transform('x', 'a', 'b') == 'p')
+
+    # z shares its value with the missing data placeholder of b
+    result = lut.transform('z', 'a', 'b')
+    assert(result != result)
+
+def lut_compiled_001_test():
+    root = tempfile.mkdtemp()
+    try:
+        source = os.path.join(root, 'names.lut')
+        with open(source, 'w') as f:
+            f.write('LONG SHORT\nname nm\npriority pri\n')
+        # compiled LUTs are written to the user cache directory
+        os.environ['STITCH_CACHE'] = os.path.join(root, 'cache')
+        compiled = tuner.get_compiled_path(root)
+        assert(os.path.dirname(compiled) == os.environ['STITCH_CACHE'])
+
+        expected = tuner.get_master_lut([source], compiled)
+        assert(os.path.exists(compiled) and os.path.exists(compiled + '.npy'))
+        result = tuner.get_master_lut([source], compiled)
+        # lookup dictionaries are only built once used
+        assert(result._key_maps == {})
+        assert(result.keys.to_dataframe().equals(expected.keys.to_dataframe()))
+        assert(result.values.to_dataframe().equals(expected.values.to_dataframe()))
+        assert(result.transform(['priority', 'name'], 'LONG', 'SHORT') == ['pri', 'nm'])
+
+        # compiled LUTs are rebuilt once their source changes
+        with open(source, 'a') as f:
+            f.write('status stat\n')
+        result = tuner.get_master_lut([source], compiled)
+        assert(result.transform('status', 'LONG', 'SHORT') == 'stat')
+        result = StitchLUT()
+        result.read_compiled(compiled, checksum=tuner.get_checksum([source]))
+        assert(result.transform('status', 'LONG', 'SHORT') == 'stat')
+    finally:
+        os.environ.pop('STITCH_CACHE', None)
+        shutil.rmtree(root)
+
 def string_parse_001_test():
     st = StitchString(_YAML)
     string = 'sceneHOUSE100.shot42_layer05.v001.exr'
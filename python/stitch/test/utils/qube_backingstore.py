@@ -6,6 +6,7 @@ import re
 import json
 import time
 from copy import copy
+from multiprocessing.pool import ThreadPool
 from datetime import datetime
 import numpy as np
 import pandas as pd
@@ -14,7 +15,9 @@ from stitch.core.stitch_frame import StitchFrame
 from stitch.core.utils import *
 from stitch.frameworks.probe.backingstore import BackingStore
 from stitch.test.utils.renderlog_backingstore import RenderLogBackingStore
+from stitch.test.utils.renderlog_utils import classify_lines
 from stitch.test.utils.qube_utils import *
+from stitch.test.utils import qb
 from stitch.core.errors import *
 # ------------------------------------------------------------------------------
 
@@ -27,6 +30,8 @@ from stitch.core.errors import *
 '''
 
 class QubeBackingStore(BackingStore):
+	key = ['id']
+
 	def __init__(self,
 						jobinfo=False,
 						hostinfo=False,
@@ -38,9 +43,13 @@ class QubeBackingStore(BackingStore):
 						id=None,
 						status=None,
 						subjobs=False,
-						embed_graphs=False):
+						embed_graphs=False,
+						incremental=False,
+						stdout_batch_size=100,
+						stdout_threads=4,
+						database=None):
 
-		super(QubeBackingStore, self).__init__(name=name)
+		super(QubeBackingStore, self).__init__(incremental=incremental)
 		self._jobinfo = jobinfo
 		self._hostinfo = hostinfo
 		self._supervisor = supervisor
@@ -52,7 +61,12 @@ class QubeBackingStore(BackingStore):
 		self._status = status
 		self._subjobs = subjobs
 		self._embed_graphs = embed_graphs
+		self._stdout_batch_size = stdout_batch_size
+		self._stdout_threads = stdout_threads
 		self._database = qb
+		if database is not None:
+			# stand-ins for the qb module
+			self._database = database
 		self._data = None
 		self._results = None
 
@@ -60,93 +74,132 @@ class QubeBackingStore(BackingStore):
 	# --------------------------------------------------------------------------
 
 	def _get_agenda_stats(self, data):
-		sdata = StitchFrame(data)
-		sdata.merge_columns(['agenda', 'id'],
-			func=lambda x: get_agenda_stats(x[x.index[0]], x[x.index[1]], self._embed_graphs),
-			new_column='agenda')
-		sdata.flatten(columns=['agenda'])
-		data = sdata._data
+		stats = get_batch_agenda_stats(data['agenda'].tolist(), data['id'].tolist(),
+			embed_graphs=self._embed_graphs)
+		stats = DataFrame(stats, index=data.index)
+		stats.columns = ['agenda_' + str(x) for x in stats.columns]
+
+		# stats replace the agenda column
+		i = data.columns.get_loc('agenda')
+		data = pd.concat([data.iloc[:, :i], stats, data.iloc[:, i + 1:]], axis=1)
 		return data
 
 	def _get_log_data(self, data):
 		mask = data['agenda_subids'].dropna()
 		data.loc[mask.index, 'stdout_subids'] = data['id'].apply(lambda x: str(x))
 
-		sdata = StitchFrame(data)
-		sdata.merge_columns(['stdout_subids', 'agenda_subids'],
-			func=lambda x: create_complete_subids( x[x.index[0]], x[x.index[1]] ),
-			new_column='stdout_subids', iterables=True, inplace=True)
+		data['stdout_subids'] = [create_complete_subids(id, subids) for id, subids
+			in zip(data['stdout_subids'], data['agenda_subids'])]
 
-		sdata._data['stdout'] = sdata._data['stdout_subids'].apply(lambda x: self._get_stdout_data(x))
-		mask = sdata._data['stdout'].dropna()
-		sdata._data['stdout'] = sdata._data['stdout'].apply(lambda x: self._get_stdout_stats(x))
+		sdata = StitchFrame(data)
+		stdout = self._get_stdout_data(sdata._data['stdout_subids'])
+		sdata._data['stdout'] = self._get_stdout_stats(stdout)
 		sdata.flatten(columns=['stdout'], inplace=True)
 		data = sdata._data
 		return data
 
 	def _get_callbacks(self, data):
-		sdata = StitchFrame(data)
-		data = sdata.merge_columns(['pgrp', 'callbacks'],
-			func=lambda x: [ x[x.index[0]], x[x.index[1]] ], new_column='dependency')
-
-		def _get_dependency(item):
-			if item:
-				pgrp = item[0]
+		# label to id maps of process groups, each queried once
+		labels = {}
+		def _get_labels(pgrp):
+			if pgrp not in labels:
 				jobs = self._database.jobinfo(filters={'pgrp':pgrp})
-				labels = {}
-				for job in jobs:
-					labels[job['label']] = job['id']
-				output = []
-
-				deps = json.loads(item[1])
-				deps = deps['triggers'].split('and')
-				if deps[0] not in [u'', '', None]:
-					deps = [x.split('-')[2].strip(' ') for x in deps]
-					for dep in deps:
-						new_item = dep
-						if dep in labels:
-							new_item = labels[dep]
-						output.append(new_item)
-				else:
-					output.append(pgrp)
-				return output
-
-			return np.nan
-
-		data['dependency'] = data['dependency'].apply(lambda x: _get_dependency(x))
+				labels[pgrp] = dict((job['label'], job['id']) for job in jobs)
+			return labels[pgrp]
+
+		def _get_dependency(pgrp, callbacks):
+			output = []
+			deps = json.loads(callbacks)
+			deps = deps['triggers'].split('and')
+			if deps[0] not in [u'', '', None]:
+				deps = [x.split('-')[2].strip(' ') for x in deps]
+				for dep in deps:
+					output.append(_get_labels(pgrp).get(dep, dep))
+			else:
+				output.append(pgrp)
+			return output
+
+		data['dependency'] = [_get_dependency(pgrp, callbacks) for pgrp, callbacks
+			in zip(data['pgrp'], data['callbacks'])]
 		return data
 
-	def _get_stdout_data(self, item):
-		temp = []
-		if len(item) > 1:
-			temp = self._database.stdout(item[0], *item[1:])
-		else:
-			temp = self._database.stdout(item[0])
-
-		text = ''
-		for t in temp:
-			text += t['data']
-
-		if text:
-			return text
-		else:
-			return np.nan
-
-	def _get_stdout_stats(self, item):
-		output = {'progress': np.nan, 'warning': np.nan, 'error': np.nan}
-		if item.__class__.__name__ == 'str':
-			output = {}
-			rbs = RenderLogBackingStore(text=item)
-			rbs.update()
-			data = rbs.data.data
-			output['progress'] = ' '.join(data['progress'].unique().tolist())
-			output['warning'] = ' '.join(data['warning'].unique().tolist())
-			output['error'] = ' '.join(data['error'].unique().tolist())
-		return output
+	def _get_stdout_data(self, items):
+		'''
+		Semi-private method for fetching the stdout of many jobs in bulk
+
+		Subjob ids are requested in batches of stdout_batch_size, across at
+		most stdout_threads threads.
+
+		Args:
+			items (Series): Lists of subjob ids.
+
+		Returns:
+			Series of log text, or NaN for jobs without output
+		'''
+		items = items.apply(lambda x: x if isinstance(x, list) else [])
+		subids = [x for item in items for x in item]
+		size = self._stdout_batch_size
+		batches = [subids[i:i + size] for i in range(0, len(subids), size)]
+
+		results = []
+		if batches:
+			pool = ThreadPool(min(self._stdout_threads, len(batches)))
+			try:
+				results = pool.map(lambda x: self._database.stdout(*x), batches)
+			finally:
+				pool.close()
+		# stdout returns a log per subjob id, in the order requested
+		results = iter([x['data'] for batch in results for x in batch])
+
+		output = []
+		for item in items:
+			text = ''.join(next(results) for x in item)
+			output.append(text if text else np.nan)
+		return Series(output, index=items.index)
+
+	def _get_stdout_stats(self, items):
+		'''
+		Semi-private method for summarizing the progress, warnings and errors of many logs
+
+		The lines of all logs are classified in a single pass, then
+		summarized log by log by a RenderLogBackingStore.
+
+		Args:
+			items (Series): Log text, or NaN.
+
+		Returns:
+			Series of dicts
+		'''
+		output = [{'progress': np.nan, 'warning': np.nan, 'error': np.nan} for x in items]
+		texts = [(i, x) for i, x in enumerate(items) if x.__class__.__name__ == 'str']
+		if len(texts) == 0:
+			return Series(output, index=items.index)
+
+		lines = [text.split('\n') for i, text in texts]
+		found = classify_lines([x for item in lines for x in item])
+
+		store = RenderLogBackingStore()
+		start = 0
+		for (i, text), item in zip(texts, lines):
+			# data and classifications are indexed by the line's position
+			data = DataFrame({'raw_data': item}, columns=['raw_data'])
+			data['filepath'] = str(i)
+			data['line'] = data.index + 1
+			classes = found.iloc[start:start + len(item)].reset_index(drop=True)
+			start += len(item)
+
+			mask = (data['raw_data'] != '').values
+			data = store._line_data(data[mask], classes[mask]).fillna('')
+
+			stats = {'progress': '', 'warning': '', 'error': ''}
+			for key in stats.keys():
+				stats[key] = ' '.join(data[key].unique().tolist())
+			output[i] = stats
+		return Series(output, index=items.index)
 	# --------------------------------------------------------------------------
 
-	def _job_update(self):
-		data = pd.read_json(self._job_data, orient='records')
+	def _process(self, records):
+		data = pd.read_json(json.dumps(records), orient='records')
 		data = data.applymap(lambda x: {} if x is None else x)
 
 		sdata = StitchFrame(data)
@@ -155,10 +208,9 @@ class QubeBackingStore(BackingStore):
 		data = data.applymap(lambda x: str_to_nan(x))
 
 		# Add custom fields
-		data['procs'] = data['reservations'].apply(lambda x: get_procs(x))
-		data['procs+'] = data['reservations'].apply(lambda x: get_plus_procs(x))
-		data['ram'] = data['reservations'].apply(lambda x: get_ram(x))
-		data['ram+'] = data['reservations'].apply(lambda x: get_plus_ram(x))
+		reservations = get_reservations(data['reservations'])
+		for column in ['procs', 'procs+', 'ram', 'ram+']:
+			data[column] = reservations[column]
 		data['failed_frame_total'] = data['todotally_failed']
 		data['percent_done'] = data['todotally_complete'] / data['todo']
 		data['percent_done'] = data['percent_done'].apply(lambda x: round_to(x, 3) * 100)
@@ -180,15 +232,18 @@ class QubeBackingStore(BackingStore):
 		if self._callbacks:
 			data = self._get_callbacks(data)
 
-		data.fillna('', inplace=True)
-		data['probe_id'] = data.index
 		data.reset_index(drop=True, inplace=True)
+		return data
 
-		sdata = StitchFrame(data)
-		self._data = sdata
+	def _finalize(self, data):
+		# only fill untyped columns, so numeric columns keep their dtype
+		data = StitchFrame(data).compact()._data
+		columns = data.columns[data.dtypes == object]
+		data[columns] = data[columns].fillna('')
+		return data
 
 	@property
-	def _job_data(self):
+	def _job_records(self):
 		jobs = self._database.jobinfo(fields=self._fields,
 									  filters=self._filters,
 									  id=self._id,
@@ -196,8 +251,11 @@ class QubeBackingStore(BackingStore):
 									  agenda=self._agenda,
 									  subjobs=self._subjobs,
 								      callbacks=self._callbacks)
-		jobs = json.dumps([dict(job) for job in jobs])
-		return jobs
+		return [dict(job) for job in jobs]
+
+	@property
+	def _job_data(self):
+		return json.dumps(self._job_records)
 	# --------------------------------------------------------------------------
 
 	def _host_update(self):
@@ -212,7 +270,9 @@ class QubeBackingStore(BackingStore):
 
 		data = DataFrame(data)
 		data = data.applymap(lambda x: np.nan if x is {} else x)
-		data['slots'] = data['resources'].apply(lambda x: get_slots(x))
+		slots = get_batch_slots(data['resources'])
+		data['slots_used'] = slots['used']
+		data['slots_total'] = slots['total']
 		data['subjobs'] = data['subjobs'].apply(lambda x: x[0])
 
 		sdata = StitchFrame(data)
@@ -234,6 +294,7 @@ class QubeBackingStore(BackingStore):
 		data.reset_index(drop=True, inplace=True)
 		data['probe_id'] = data.index
 		sdata._data = data
+		sdata.compact(inplace=True)
 
 		self._data = sdata
 
@@ -261,9 +322,27 @@ class QubeBackingStore(BackingStore):
 		else:
 			raise NotFound('Database not specified')
 
+	def _get_records(self):
+		return self._job_records
+
+	def _diff_records(self, records):
+		output, removed, prints = super(QubeBackingStore, self)._diff_records(records)
+		if self._agenda:
+			# agenda stats of running frames depend on the time of the update,
+			# so those jobs are processed on every update, changed or not
+			changed = set(id(x) for x in output)
+			output = [x for x in records if id(x) in changed or self._is_running(x)]
+		return output, removed, prints
+
+	def _is_running(self, record):
+		agenda = record.get('agenda')
+		if not isinstance(agenda, list):
+			return False
+		return any(x.get('status') == 'running' for x in agenda)
+
 	def update(self):
 		if self._jobinfo:
-			self._job_update()
+			super(QubeBackingStore, self).update()
 		elif self._hostinfo:
 			self._host_update()
 		else:
@@ -271,7 +350,7 @@ class QubeBackingStore(BackingStore):
 	# --------------------------------------------------------------------------
 
 	def set_priority(self, priority):
-		job_ids = self._results.data['id'].tolist()
+		job_ids = self._results.to_dataframe()['id'].tolist()
 		self._database.set_priority(job_ids, priority)
 # ------------------------------------------------------------------------------
 
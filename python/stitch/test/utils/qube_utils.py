@@ -3,6 +3,7 @@ from itertools import *
 from functools import *
 import re
 from copy import copy
+from collections import OrderedDict
 import time
 import numpy as np
 from pandas import DataFrame
@@ -65,9 +66,12 @@ def fix_missing_fields(database, fields):
 
 	return database
 
+_SLOTS_RE = re.compile(r'host\.processors=(\d+)/(\d+)')
+_PROCS_RE = re.compile(r'processors=(\d+)(\+?)')
+_RAM_RE = re.compile(r'memory=(\d+)(\+?)')
+
 def get_slots(item):
-	slots_re = re.compile('host\.processors=(\d+)/(\d+)')
-	found = slots_re.search(item)
+	found = _SLOTS_RE.search(item)
 	if found:
 		return {'used': int(found.group(1)), 'total': int(found.group(2))}
 	else:
@@ -80,37 +84,89 @@ def str_to_nan(item):
 		return item
 
 def get_procs(item):
-	procs_re = re.compile('processors=(\d+)')
-	found = procs_re.search(item)
+	found = _PROCS_RE.search(item)
 	if found:
 		return int(found.group(1))
 	else:
 		return ''
 
 def get_plus_procs(item):
-	procs_re = re.compile('processors=\d+(.)')
-	found = procs_re.search(item)
+	found = _PROCS_RE.search(item)
 	if found:
-		if found.group(1) == '+':
-			return '+'
+		return found.group(2)
 	return ''
 
 def get_ram(item):
-	ram_re = re.compile('memory=(\d+)')
-	found = ram_re.search(item)
+	found = _RAM_RE.search(item)
 	if found:
 		return int(found.group(1))
 	else:
 		return ''
 
 def get_plus_ram(item):
-	pram_re = re.compile('memory=\d+(.)')
-	found = pram_re.search(item)
+	found = _RAM_RE.search(item)
 	if found:
-		if found.group(1) == '+':
-			return '+'
+		return found.group(2)
 	return ''
 
+def extract_fields(items, fields, numeric=[]):
+	'''
+	Extract the named groups of many regular expressions in a single pass
+
+	Each field is searched for independently of the others, anywhere within an
+	item, as the individual searches would be.
+
+	Args:
+		items (Series): Strings to be searched.
+		fields (list): Regular expressions with named groups.
+		numeric (list, optional): Groups to be converted to numbers.
+
+	Returns:
+		DataFrame with a column per group, NaN where its field is not found
+	'''
+	pattern = ''.join('(?=(?:.*?' + x + ')?)' for x in fields)
+	data = items.astype(str).str.extract(pattern, flags=re.DOTALL, expand=True)
+	for column in numeric:
+		values = data[column].astype(float)
+		if values.notnull().all():
+			values = values.astype(np.int64)
+		data[column] = values
+	return data
+
+_RESERVATION_FIELDS = [
+	r'processors=(?P<procs>\d+)(?P<procs_plus>\+?)',
+	r'memory=(?P<ram>\d+)(?P<ram_plus>\+?)'
+]
+_SLOT_FIELDS = [r'host\.processors=(?P<used>\d+)/(?P<total>\d+)']
+
+def get_reservations(items):
+	'''
+	Parse the processors and memory reservations of many jobs
+
+	Args:
+		items (Series): Reservation strings.
+
+	Returns:
+		DataFrame of numeric procs and ram columns, and procs+ and ram+ columns
+		of '+' or ''
+	'''
+	data = extract_fields(items, _RESERVATION_FIELDS, numeric=['procs', 'ram'])
+	data.rename(columns={'procs_plus': 'procs+', 'ram_plus': 'ram+'}, inplace=True)
+	data[['procs+', 'ram+']] = data[['procs+', 'ram+']].fillna('')
+	return data
+
+def get_batch_slots(items):
+	'''
+	Parse the used and total slots of many hosts
+
+	Args:
+		items (Series): Resource strings.
+
+	Returns:
+		DataFrame of numeric used and total columns
+	'''
+	return extract_fields(items, _SLOT_FIELDS, numeric=['used', 'total'])
+
 def get_jobtype(item):
 	job_re = re.compile('maya|mayabatch|nuke|vray|vrscene|houdini|generate|email|shotgun',
 						flags=re.IGNORECASE)
@@ -120,17 +176,63 @@ def get_jobtype(item):
 	else:
 		return np.nan
 
-def get_agenda_stats(item, id, embed_graphs=False):
+_EPOCH = 946800000
+_ROUNDING = 2
+
+def _get_frame_graphs(data, id):
+	# span graphs of all, failed, complete and running frames
+	fg = data[['span']].copy()
+	fg.columns = ['all']
+
+	fg['failed'] = fg['all']
+	mask = data[data['status'] != 'failed']
+	fg.loc[mask.index, 'failed'] = np.nan
+
+	fg['complete'] = fg['all']
+	mask = data[data['status'] != 'complete']
+	fg.loc[mask.index, 'complete'] = np.nan
+
+	fg['running'] = fg['all']
+	mask = data[data['status'] != 'running']
+	fg.loc[mask.index, 'running'] = np.nan
+
+	fg = fg.sort_values('all', ascending=False)
+	fg.dropna(how='all', inplace=True)
+	fg.reset_index(drop=True, inplace=True)
+
+	output = {}
+	fg2 = fg.copy()[['all']]
+	fg2.columns = [[id], ['all']]
+	output['frame_graph'] = fg2.to_dict()
+
+	fg.columns = [[id] * 4, ['all', 'failed', 'complete', 'running']]
+	output['frame_graph_detailed'] = fg.to_dict()
+	return output
+
+def _get_frame_distribution(frame_sum, frame_min, frame_max, count):
+	s = frame_sum - (frame_min * count)
+	f = (frame_max - frame_min) * count
+	d = np.nan
+	try:
+		d = s/f
+		d = round_to(d, 3)
+	except ZeroDivisionError:
+		pass
+	return d
+
+def get_agenda_stats(item, id, embed_graphs=False, now=None):
+	if now is None:
+		now = time.time()
 	data = DataFrame(item)
-	rounding = 2
-	epoch = 946800000
+	rounding = _ROUNDING
+	epoch = _EPOCH
 
 	# Coerce bad timestamps
 	data['timestart'] = data['timestart'].apply(lambda x: np.nan if x < epoch else x)
 
 	# Add framespan and failedframes
 	mask = data[data['status'] == 'running']
-	data.loc[mask.index, 'lastupdate'] = time.time()
+	data.loc[mask.index, 'lastupdate'] = now
 	data['span'] = (data['lastupdate'] - data['timestart']) / 3600
 
 	output = {}
@@ -144,21 +246,13 @@ def get_agenda_stats(item, id, embed_graphs=False):
 	frmcomp = output['frame_complete_total'] / output['frame_total']
 	output['frame_complete_percent'] = round_to(frmcomp, 3)
 
-	c = len(mask)
-	s = output['frame_sum'] - (output['frame_min'] * c)
-	f = (output['frame_max'] - output['frame_min']) * c
-	d = np.nan
-	try:
-		d = s/f
-		d = round_to(d, 3)
-	except ZeroDivisionError:
-		pass
-	output['frame_distribution'] = d
+	output['frame_distribution'] = _get_frame_distribution(
+		output['frame_sum'], output['frame_min'], output['frame_max'], len(mask))
 
 	failed = data[data['status'] == 'failed']
 	output['failed_frames_total'] = len(failed)
-	output['failed_frame_names'] = ', '.join(failed['name'].tolist())
-	output['failed_frame_hosts'] = ', '.join(failed['host'].tolist())
+	output['failed_frame_names'] = ', '.join(failed['name'].apply(str).tolist())
+	output['failed_frame_hosts'] = ', '.join(failed['host'].apply(str).tolist())
 	output['host_total']         = data['host'].nunique()
 	output['pid_total']          = data['pid'].nunique()
 	output['status_total']       = data['status'].nunique()
@@ -180,32 +274,109 @@ def get_agenda_stats(item, id, embed_graphs=False):
 	output['failed_subids'] 	 = ', '.join(subids)
 
 	if embed_graphs:
-		fg = data[['span']].copy()
-		fg.columns = ['all']
+		output.update(_get_frame_graphs(data, id))
+
+	return output
 
-		fg['failed'] = fg['all']
-		mask = data[data['status'] != 'failed']
-		fg.loc[mask.index, 'failed'] = np.nan
+def get_batch_agenda_stats(items, ids, embed_graphs=False, now=None):
+	'''
+	Batched equivalent of get_agenda_stats
 
-		fg['complete'] = fg['all']
-		mask = data[data['status'] != 'complete']
-		fg.loc[mask.index, 'complete'] = np.nan
+	All agendas are exploded into a single frame, keyed by job, from which
+	each statistic is computed with a single groupby aggregation.
 
-		fg['running'] = fg['all']
-		mask = data[data['status'] != 'running']
-		fg.loc[mask.index, 'running'] = np.nan
+	Args:
+		items (list): Agendas, lists of frame dicts.
+		ids (list): Job ids.
+		embed_graphs (bool, optional): Add frame graphs. Default: False
+		now (float, optional): Time of running frames' last update.
+			Default: time.time()
 
-		fg = fg.sort_values('all', ascending=False)
-		fg.dropna(how='all', inplace=True)
-		fg.reset_index(drop=True, inplace=True)
+	Returns:
+		list of stat dicts, one per agenda
+	'''
+	if now is None:
+		now = time.time()
+	items = [x if isinstance(x, list) else [] for x in items]
+	jobs = range(len(items))
+	data = DataFrame([frame for item in items for frame in item])
+	if len(data) == 0:
+		return [{} for x in items]
+	data['job'] = np.repeat(list(jobs), [len(x) for x in items])
 
-		fg2 = fg.copy()[['all']]
-		fg2.columns = [[id], ['all']]
-		output['frame_graph'] = fg2.to_dict()
+	# Coerce bad timestamps
+	data['timestart'] = data['timestart'].where(~(data['timestart'] < _EPOCH))
 
-		fg.columns = [[id] * 4, ['all', 'failed', 'complete', 'running']]
-		output['frame_graph_detailed'] = fg.to_dict()
+	# Add framespan and failedframes
+	running = data['status'] == 'running'
+	data['lastupdate'] = data['lastupdate'].where(~running, now)
+	data['span'] = (data['lastupdate'] - data['timestart']) / 3600
 
+	mask = data[data['span'] > (0.5 / 60)] # Drop frames under 30 sec
+	data['subid_str'] = data['subid'].apply(str)
+	failed = data[data['status'] == 'failed']
+	subids = data.drop_duplicates(['job', 'subid_str'])
+
+	join = lambda x: ', '.join(x.apply(str).tolist())
+	groups = data.groupby('job')
+	masks = mask.groupby('job')
+	stats = DataFrame(index=jobs)
+	stats['frame_max']            = masks['span'].max()
+	stats['frame_min']            = masks['span'].min()
+	stats['frame_sum']            = masks['span'].sum()
+	stats['frame_retry']          = masks['retry'].max()
+	stats['frame_count']          = masks.size()
+	stats['frame_total']          = groups.size()
+	stats['frame_complete_total'] = mask[mask['status'] == 'complete'].groupby('job').size()
+	stats['failed_frames_total']  = failed.groupby('job').size()
+	stats['failed_frame_names']   = failed.groupby('job')['name'].agg(join)
+	stats['failed_frame_hosts']   = failed.groupby('job')['host'].agg(join)
+	stats['failed_subids']        = failed.groupby('job')['subid_str'].agg(join)
+	stats['subids']               = subids.groupby('job')['subid_str'].agg(join)
+	for column in ['host', 'pid', 'status', 'subid', 'name']:
+		stats[column + '_total'] = groups[column].nunique()
+	for column in ['count', 'id', 'retry', 'retrydelay', 'timecomplete', 'timecumulative']:
+		stats[column + '_max'] = groups[column].max()
+	stats['timestart_min'] = groups['timestart'].min()
+
+	# jobs without frames are missing from groups
+	for column in ['frame_sum', 'frame_count', 'frame_complete_total', 'failed_frames_total']:
+		stats[column] = stats[column].fillna(0)
+	for column in ['failed_frame_names', 'failed_frame_hosts', 'failed_subids', 'subids']:
+		stats[column] = stats[column].fillna('')
+
+	graphs = {}
+	if embed_graphs:
+		for job, group in groups:
+			graphs[job] = _get_frame_graphs(group, ids[job])
+
+	output = []
+	for job, row in zip(jobs, stats.to_dict('records')):
+		if len(items[job]) == 0:
+			output.append({})
+			continue
+
+		item = OrderedDict()
+		item['frame_max']              = round_to(row['frame_max'], _ROUNDING)
+		item['frame_min']              = round_to(row['frame_min'], _ROUNDING)
+		item['frame_sum']              = round_to(row['frame_sum'], _ROUNDING)
+		item['frame_retry']            = round_to(row['frame_retry'], _ROUNDING)
+		item['frame_total']            = int(row['frame_total'])
+		item['frame_complete_total']   = int(row['frame_complete_total'])
+		frmcomp = item['frame_complete_total'] / item['frame_total']
+		item['frame_complete_percent'] = round_to(frmcomp, 3)
+		item['frame_distribution']     = _get_frame_distribution(
+			item['frame_sum'], item['frame_min'], item['frame_max'], int(row['frame_count']))
+
+		for key in ['failed_frames_total', 'host_total', 'pid_total', 'status_total',
+					'subid_total', 'name_total']:
+			item[key] = int(row[key])
+		for key in ['failed_frame_names', 'failed_frame_hosts', 'count_max', 'id_max',
+					'retry_max', 'retrydelay_max', 'timecomplete_max', 'timecumulative_max',
+					'timestart_min', 'subids', 'failed_subids']:
+			item[key] = row[key]
+		item.update(graphs.get(job, {}))
+		output.append(dict(item))
 	return output
 
 def create_complete_subids(id, subids):
@@ -225,8 +396,9 @@ def main():
 	help(__main__)
 
 __all__ = [ 'flatten_qube_field', 'fix_missing_fields', 'get_slots', 'str_to_nan',
-			'get_procs', 'get_plus_procs', 'get_ram', 'get_plus_ram', 'get_jobtype',
-			'get_agenda_stats', 'create_complete_subids']
+			'get_procs', 'get_plus_procs', 'get_ram', 'get_plus_ram', 'extract_fields',
+			'get_reservations', 'get_batch_slots', 'get_jobtype',
+			'get_agenda_stats', 'get_batch_agenda_stats', 'create_complete_subids']
 
 if __name__ == '__main__':
 	main()
@@ -2,11 +2,15 @@ from __future__ import with_statement, print_function, absolute_import
 from itertools import *
 from functools import *
 import os
+import json
+import hashlib
+import mmap
 import warnings
 import re
+from multiprocessing import Pool
 import numpy as np
 import pandas as pd
-from pandas import DataFrame
+from pandas import DataFrame, Series
 from stitch.core.stitch_frame import StitchFrame
 from stitch.frameworks.probe.backingstore import BackingStore
 from stitch.test.utils.renderlog_utils import *
@@ -23,30 +27,128 @@ from stitch.core.errors import *
 '''
 
 class RenderLogBackingStore(BackingStore):
-	def __init__(self, path=None, text=None, expand=False):
-		super(RenderLogBackingStore, self).__init__()
+	'''
+	Backingstore for the warnings, errors and progress of render logs
+
+	In stream mode, log files are read in chunks of chunk_size characters and
+	only lines of interest are kept: warnings, errors, the final line (for
+	progress) and, when expanded, the traceback_window lines following each
+	traceback.  Peak memory is thereby bounded by chunk_size and the number of
+	matches, rather than the size of the logs.  Expanded logs without any
+	traceback chunks only retain those lines, instead of every line.
+
+	In memory_map mode, log files are memory mapped and their bytes scanned for
+	the literal substrings of warnings, errors and tracebacks.  Only lines
+	containing them are decoded, and raw_data holds a LineReference to each
+	line rather than its text, which is only read when displayed.  raw_data
+	is kept whether or not logs are expanded.
+
+	In follow mode, the byte offset and inode of each log file are remembered,
+	so that only bytes appended since the last update are read.  Logs are
+	read from the start again if they are rotated (new inode) or truncated
+	(smaller than the offset, or with different leading bytes).  Only lines
+	of interest are kept between updates, as in stream mode.  Given a
+	checkpoint filepath, this state is also saved to disk, so that a new
+	backingstore can resume where the last one stopped.
+
+	Given a number of processes, log files are parsed in parallel by a process
+	pool, each worker reading its own files.
+
+	Args:
+		path (str, optional): Log file or directory of log files.
+		text (str, optional): Log text, used instead of path.
+		expand (bool, optional): Keep tracebacks along with their errors.
+		incremental (bool, optional): Patch data on update instead of rebuilding it.
+		stream (bool, optional): Read log files in chunks. Default: False
+		chunk_size (int, optional): Characters per chunk. Default: 1048576
+		processes (int, optional): Worker processes for parsing log files.
+			Default: None
+		memory_map (bool, optional): Scan memory mapped log files. Default: False
+		follow (bool, optional): Only read bytes appended to log files.
+			Default: False
+		checkpoint (str, optional): JSON filepath for persisting follow
+			state. Default: None
+	'''
+	traceback_window = 100
+	# leading bytes checked to detect truncated logs
+	_head_size = 64
+
+	def __init__(self, path=None, text=None, expand=False, incremental=False,
+				 stream=False, chunk_size=1048576, processes=None, memory_map=False,
+				 follow=False, checkpoint=None):
+		super(RenderLogBackingStore, self).__init__(incremental=incremental)
 
 		self._data = None
 		self._results = None
 		self._path = path
 		self._text = text
 		self._expand = expand
+		self._stream = stream
+		self._chunk_size = chunk_size
+		self._processes = processes
+		self._memory_map = memory_map
+		self._follow = follow
+		self._checkpoint = checkpoint
+		self._follow_states = {}
+		if follow and checkpoint and os.path.exists(checkpoint):
+			self._load_checkpoint()
 	# --------------------------------------------------------------------------
 
 	@property
 	def path(self):
 		return self._path
 
-	def _get_dir_data(self, path):
+	@property
+	def stream(self):
+		return self._stream
+
+	@property
+	def processes(self):
+		return self._processes
+
+	@property
+	def follow(self):
+		return self._follow
+
+	@property
+	def _by_reference(self):
+		# records are file references, read only when processed
+		by_reference = self._stream or self._processes or self._memory_map or self._follow
+		return bool(self._path and not self._text and by_reference)
+
+	@property
+	def key(self):
+		# expanded logs may contain the same line more than once
+		if self._expand:
+			return []
+		return ['filepath', 'line']
+
+	def _get_filepaths(self, path):
+		if not os.path.isdir(path):
+			return [path]
+
 		output = []
 		for root, dirs, files in os.walk(path):
 			for f in files:
-				file_ = os.path.join(root, f)
-				with open(file_, 'r') as log:
-					readlines = log.readlines()
-					if len(readlines) > 0:
-						data = [[x, file_] for x in readlines]
-						output.append(data)
+				output.append(os.path.join(root, f))
+		return output
+
+	def _get_dir_data(self, path):
+		output = []
+		for file_ in self._get_filepaths(path):
+			with open(file_, 'r') as log:
+				readlines = log.readlines()
+				if len(readlines) > 0:
+					data = [[x, file_] for x in readlines]
+					output.append(data)
+		return output
+
+	def _get_file_stats(self, path):
+		output = []
+		for file_ in self._get_filepaths(path):
+			stat = os.stat(file_)
+			if stat.st_size > 0:
+				output.append((file_, stat.st_size, stat.st_mtime))
 		return output
 
 	@property
@@ -56,6 +158,8 @@ class RenderLogBackingStore(BackingStore):
 			output = [[x, ''] for x in output]
 			return [output]
 		elif self._path:
+			if self._by_reference:
+				return self._get_file_stats(self._path)
 			if os.path.isdir(self._path):
 				return self._get_dir_data(self._path)
 			else:
@@ -66,19 +170,317 @@ class RenderLogBackingStore(BackingStore):
 		else:
 			raise NotFound('Please provide a file path, directory path or readlines data')
 
+	def _read_chunks(self, filepath):
+		'''
+		Semi-private generator of the non-empty lines of a file, chunk by chunk
+
+		Yields:
+			DataFrame of raw_data, filepath and line columns, indexed by
+			line - 1
+		'''
+		start = 0
+		remainder = ''
+		with open(filepath, 'r') as log:
+			while True:
+				chunk = log.read(self._chunk_size)
+				if not chunk:
+					break
+				lines = (remainder + chunk).split('\n')
+				remainder = lines.pop()
+				yield self._chunk_data(lines, filepath, start)
+				start += len(lines)
+
+		if remainder:
+			yield self._chunk_data([remainder], filepath, start)
+
+	def _chunk_data(self, lines, filepath, start):
+		data = DataFrame({'raw_data': lines}, index=range(start, start + len(lines)))
+		data['filepath'] = filepath
+		data['line'] = data.index + 1
+		return data[data['raw_data'] != '']
+
+	def _filter_chunk(self, data, window):
+		'''
+		Semi-private method for keeping only the lines of interest in a chunk
+
+		Args:
+			data (DataFrame): Chunk of lines, indexed by position.
+			window (int): Last position within a preceding traceback window.
+
+		Returns:
+			(data, classes, last, window) tuple of kept lines, their
+			classifications, the last line and its classification, and the
+			updated window
+		'''
+		classes = classify_lines(data['raw_data'].tolist(), index=data.index)
+		last = (data.tail(1), classes.tail(1))
+
+		mask = classes['warning'].notnull() | classes['error'].notnull()
+		if self._expand:
+			keep = data.index <= window
+			for tb in classes['traceback'].dropna().index:
+				keep |= (data.index >= tb) & (data.index < tb + self.traceback_window)
+				window = tb + self.traceback_window - 1
+			mask |= keep
+
+		return data[mask], classes[mask], last, window
+
+	def _stream_log_data(self, filepath):
+		'''
+		Semi-private method for extracting data from a log file, a chunk at a time
+
+		Only lines of interest are kept from each chunk, before being passed
+		to _line_data as a whole.
+		'''
+		output = []
+		found = []
+		last = None
+		# traceback context extends into following chunks
+		window = -1
+		for data in self._read_chunks(filepath):
+			if len(data) == 0:
+				continue
+			data, classes, last, window = self._filter_chunk(data, window)
+			output.append(data)
+			found.append(classes)
+
+		if last is None:
+			return None
+
+		# progress is taken from the last line of the log
+		output.append(last[0])
+		found.append(last[1])
+		data = pd.concat(output)
+		found = pd.concat(found)
+		mask = ~data.index.duplicated()
+		return self._line_data(data[mask], found[mask])
+
+	def _get_head(self, log, size):
+		log.seek(0)
+		return hashlib.md5(log.read(size)).hexdigest()
+
+	def _follow_log_data(self, filepath):
+		'''
+		Semi-private method for extracting data from a log file, reading only appended bytes
+
+		Lines of interest are accumulated in the log's follow state, the last
+		line is replaced by each read.  An incomplete final line is parsed but
+		not consumed, so it is read again once complete.
+		'''
+		stat = os.stat(filepath)
+		state = self._follow_states.get(filepath)
+		with open(filepath, 'rb') as log:
+			if state is not None:
+				head = self._get_head(log, min(state['offset'], self._head_size))
+				if state['inode'] != stat.st_ino or stat.st_size < state['offset'] \
+					or head != state['head']:
+					# rotated or truncated
+					state = None
+
+			if state is None:
+				state = dict(inode=stat.st_ino, offset=0, line=0, window=-1, head=None,
+							 data=None, found=None, last=None)
+
+			output = []
+			found = []
+			if state['data'] is not None:
+				output.append(state['data'])
+				found.append(state['found'])
+
+			remainder = b''
+			log.seek(state['offset'])
+			while True:
+				chunk = log.read(self._chunk_size)
+				if not chunk:
+					break
+				lines = (remainder + chunk).split(b'\n')
+				remainder = lines.pop()
+				state['offset'] += sum(len(x) for x in lines) + len(lines)
+
+				# CRLF line endings are stripped, as in universal newline mode
+				lines = [x.rstrip(b'\r').decode('utf-8', 'replace') for x in lines]
+				data = self._chunk_data(lines, filepath, state['line'])
+				state['line'] += len(lines)
+				if len(data) == 0:
+					continue
+
+				data, classes, state['last'], state['window'] = self._filter_chunk(data, state['window'])
+				output.append(data)
+				found.append(classes)
+
+			state['head'] = self._get_head(log, min(state['offset'], self._head_size))
+
+		if output:
+			data = pd.concat(output)
+			found = pd.concat(found)
+			if not self._expand:
+				# only the first occurrence of a warning or error is reported
+				mask = ~found.duplicated(['warning', 'error']).values
+				data = data[mask]
+				found = found[mask]
+			state['data'] = data
+			state['found'] = found
+		self._follow_states[filepath] = state
+
+		last = state['last']
+		remainder = remainder.rstrip(b'\r').decode('utf-8', 'replace')
+		if remainder:
+			data = self._chunk_data([remainder], filepath, state['line'])
+			last = (data, classify_lines([remainder], index=data.index))
+
+		if last is None:
+			return None
+
+		# progress is taken from the last line of the log
+		data = pd.concat([state['data'], last[0]])
+		found = pd.concat([state['found'], last[1]])
+		mask = ~data.index.duplicated()
+		return self._line_data(data[mask], found[mask])
+
+	def _save_checkpoint(self):
+		# frames are stored in split orientation
+		to_dict = lambda x: None if x is None else json.loads(x.to_json(orient='split'))
+		output = {}
+		for filepath, state in self._follow_states.items():
+			state = dict(state)
+			state['data'] = to_dict(state['data'])
+			state['found'] = to_dict(state['found'])
+			if state['last'] is not None:
+				state['last'] = [to_dict(x) for x in state['last']]
+			output[filepath] = state
+
+		temp = self._checkpoint + '.tmp'
+		with open(temp, 'w') as f:
+			json.dump(output, f)
+		os.rename(temp, self._checkpoint)
+
+	def _load_checkpoint(self):
+		def from_dict(item):
+			if item is None:
+				return None
+			return pd.read_json(json.dumps(item), orient='split', dtype=False, convert_dates=False)
+
+		with open(self._checkpoint, 'r') as f:
+			states = json.load(f)
+		for filepath, state in states.items():
+			state['data'] = from_dict(state['data'])
+			state['found'] = from_dict(state['found'])
+			if state['last'] is not None:
+				state['last'] = tuple(from_dict(x) for x in state['last'])
+		self._follow_states = states
+
+	def _count_lines(self, buffer, start, stop):
+		# newlines between offsets, counted a chunk at a time
+		output = 0
+		for i in range(start, stop, self._chunk_size):
+			output += buffer[i:min(i + self._chunk_size, stop)].count(b'\n')
+		return output
+
+	def _mmap_log_data(self, filepath):
+		'''
+		Semi-private method for extracting data from a memory mapped log file
+
+		Only lines containing a warning, error or traceback literal, the lines
+		within the traceback_window of a traceback and the final line are read.
+		'''
+		with open(filepath, 'rb') as log:
+			if os.fstat(log.fileno()).st_size == 0:
+				return None
+			buffer = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+
+		try:
+			size = len(buffer)
+			literals = get_literals(traceback=self._expand)
+			starts = set()
+			# lines kept whether or not they classify as warnings or errors
+			context = set()
+			tracebacks = []
+			for literal in literals:
+				literal = literal.encode('utf-8')
+				pos = buffer.find(literal)
+				while pos != -1:
+					start = buffer.rfind(b'\n', 0, pos) + 1
+					starts.add(start)
+					if literal == b'Traceback' and pos == start:
+						tracebacks.append(start)
+						context.add(start)
+					end = buffer.find(b'\n', pos)
+					if end == -1:
+						break
+					pos = buffer.find(literal, end)
+
+			for start in tracebacks:
+				for i in range(self.traceback_window - 1):
+					start = buffer.find(b'\n', start) + 1
+					if start == 0 or start >= size:
+						break
+					starts.add(start)
+					context.add(start)
+
+			# progress is taken from the last line of the log
+			end = size
+			while end > 0 and buffer[end - 1:end] in (b'\n', b'\r'):
+				end -= 1
+			if end > 0:
+				start = buffer.rfind(b'\n', 0, end) + 1
+				starts.add(start)
+				context.add(start)
+
+			index = []
+			refs = []
+			lines = []
+			keep = []
+			line = 0
+			prev = 0
+			for start in sorted(starts):
+				line += self._count_lines(buffer, prev, start)
+				prev = start
+				end = buffer.find(b'\n', start)
+				if end == -1:
+					end = size
+				# CRLF line endings are stripped, as in universal newline mode
+				if end > start and buffer[end - 1:end] == b'\r':
+					end -= 1
+				if end == start:
+					continue
+				index.append(line)
+				keep.append(start in context)
+				refs.append(LineReference(filepath, start, end - start))
+				lines.append(buffer[start:end].decode('utf-8', 'replace'))
+		finally:
+			buffer.close()
+
+		if len(index) == 0:
+			return None
+
+		data = DataFrame({'raw_data': refs}, index=index)
+		data['filepath'] = filepath
+		data['line'] = data.index + 1
+		found = classify_lines(lines, index=index)
+
+		# literals also occur in lines which are not warnings or errors
+		mask = found['warning'].notnull() | found['error'].notnull() | keep
+		return self._line_data(data[mask], found[mask])
+
 	def _log_data(self, data):
 		data = DataFrame(data, columns=['raw_data', 'filepath'])
 		data = data.applymap(lambda x: x.strip('\n'))
 		data['line'] = data.index
 		data['line'] += 1
 		data = data[data['raw_data'] != '']
+		return self._line_data(data)
+
+	def _line_data(self, data, found=None):
+		# data is indexed by the line's position within its log
+		if found is None:
+			found = classify_lines(data['raw_data'].tolist(), index=data.index)
 
 		data['filename'] = data['filepath'].apply(lambda x: os.path.basename(x))
 
-		data['warning'] = data['raw_data'].apply(lambda x: get_warnings(x, logtype='mental ray'))
+		data['warning'] = found['warning']
 
 		data['progress'] = np.nan
-		prog = data['raw_data'].apply(lambda x: get_progress(x, logtype='alfred'))
+		prog = found['progress']
 		if len(prog) > 0:
 			mask = prog.tail(1)
 			data.loc[mask.index, 'progress'] = mask.tolist()[0]
@@ -86,11 +488,11 @@ class RenderLogBackingStore(BackingStore):
 		data2 = data.dropna(subset=['warning'])
 		data2.reset_index(drop=True, inplace=True)
 
-		err = data['raw_data'].apply(lambda x: get_errors(x))
+		err = found['error']
 		data['error'] = err
 
 		if self._expand:
-			tbs = data['raw_data'].apply(lambda x: get_tracebacks(x)).dropna()
+			tbs = found['traceback'].dropna()
 
 			# get traceback text chunks (ie traceback to error, traceback to error)
 			tbs = tbs.index.tolist()
@@ -101,7 +503,7 @@ class RenderLogBackingStore(BackingStore):
 			if tbs and errs:
 				c = 0
 				for t, e in zip(tbs, errs):
-					if e - t < 100:
+					if e - t < self.traceback_window:
 						new_chunk = range(t, e + 1)
 						chunks.extend(new_chunk)
 						mask = [str(c).zfill(3) for x in new_chunk]
@@ -126,8 +528,8 @@ class RenderLogBackingStore(BackingStore):
 
 			data['chunk'] = data['error'].bfill()
 
-			data['traceback_line'] = data['raw_data'].apply(lambda x: get_traceback_line(x))
-			data['traceback_file'] = data['raw_data'].apply(lambda x: get_traceback_file(x))
+			data['traceback_line'] = found['traceback_line']
+			data['traceback_file'] = found['traceback_file']
 
 		# merge traceback data and warning data
 		data = pd.concat([data, data2])
@@ -135,17 +537,83 @@ class RenderLogBackingStore(BackingStore):
 		data = data.applymap(lambda x: np.nan if x == '' else x)
 
 		if not self._expand:
-			data = data[['line', 'warning', 'error', 'progress', 'filepath', 'filename']]
+			columns = ['line', 'warning', 'error', 'progress', 'filepath', 'filename']
+			if self._memory_map and self._by_reference and not self._follow:
+				# memory mapped lines are kept by reference
+				columns.append('raw_data')
+			data = data[columns]
 			data.drop_duplicates(['warning', 'error', 'progress'], inplace=True)
 			data.dropna(subset=['warning', 'error', 'progress'], how='all', inplace=True)
 
 		data = data.sort_values(['filename', 'line'])
 		return data
 
-	def update(self):
-		data = []
-		for datum in self.source_data:
-			data.append(self._log_data(datum))
+	def _parse_log(self, filepath):
+		'''
+		Semi-private method for extracting data from a log file
+
+		Returns:
+			DataFrame, or None if the log is empty
+		'''
+		if self._follow:
+			return self._follow_log_data(filepath)
+		if self._memory_map:
+			return self._mmap_log_data(filepath)
+		if self._stream:
+			return self._stream_log_data(filepath)
+
+		with open(filepath, 'r') as log:
+			readlines = log.readlines()
+		if len(readlines) == 0:
+			return None
+		return self._log_data([[x, filepath] for x in readlines])
+
+	def _get_records(self):
+		records = self.source_data
+		if self._follow:
+			# follow state is dropped only for logs no longer in the listing,
+			# as incremental updates process just the logs which changed
+			files = set(x[0] for x in records)
+			for filepath in list(self._follow_states.keys()):
+				if filepath not in files:
+					del self._follow_states[filepath]
+		return records
+
+	def _get_record_key(self, record):
+		# records are entire logs, or references to them
+		if self._by_reference:
+			return record[0]
+		if len(record) == 0:
+			return self._path
+		return record[0][1]
+
+	def _process(self, records):
+		if not self._by_reference:
+			data = [self._log_data(x) for x in records]
+
+		elif self._follow:
+			# follow state lives in this process
+			data = [self._parse_log(x[0]) for x in records]
+			if self._checkpoint:
+				self._save_checkpoint()
+
+		elif self._processes and len(records) > 1:
+			settings = dict(expand=self._expand, stream=self._stream, chunk_size=self._chunk_size,
+							memory_map=self._memory_map)
+			args = [(self.__class__, settings, x[0]) for x in records]
+			chunksize = max(1, len(args) // (self._processes * 4))
+			pool = Pool(self._processes)
+			try:
+				# frames are gathered as workers finish, then concatenated once
+				data = list(pool.imap(_parse_log, args, chunksize))
+			finally:
+				pool.close()
+				pool.join()
+
+		else:
+			data = [self._parse_log(x[0]) for x in records]
+
+		data = [x for x in data if x is not None]
 		if len(data) > 1:
 			data = pd.concat(data)
 		else:
@@ -153,11 +621,37 @@ class RenderLogBackingStore(BackingStore):
 
 		data.reset_index(drop=True, inplace=True)
 		data.fillna('', inplace=True)
+		return data
 
-		data['probe_id'] = data.index
+	def _finalize(self, data):
+		# processed data is already final
+		return data.copy()
+
+	def _get_delta(self):
+		records, removed, prints = self._diff_records(self._get_records())
+		data = DataFrame(columns=self.key)
+		if len(records) > 0:
+			data = self._process(records)
+
+		# every row of a changed or removed log is replaced
+		files = [self._get_record_key(x) for x in records] + removed
+		current = self._raw
+		current = current[current['filepath'].isin(files)]
+		current = set(zip(current['filepath'], current['line']))
+		keys = list(zip(data['filepath'], data['line']))
+
+		delta = {}
+		delta['added'] = [k for k in keys if k not in current]
+		delta['changed'] = [k for k in keys if k in current]
+		delta['removed'] = list(current.difference(keys))
+		delta['data'] = data
+		return delta, prints
+# ------------------------------------------------------------------------------
 
-		sdata = StitchFrame(data)
-		self._data = sdata
+def _parse_log(args):
+	# process pool worker
+	class_, settings, filepath = args
+	return class_(**settings)._parse_log(filepath)
 # ------------------------------------------------------------------------------
 
 def main():
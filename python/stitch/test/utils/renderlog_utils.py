@@ -2,7 +2,9 @@ from __future__ import with_statement, print_function, absolute_import
 from itertools import *
 from functools import *
 import re
+from collections import OrderedDict
 import numpy
+from pandas import DataFrame
 # ------------------------------------------------------------------------------
 
 '''
@@ -13,61 +15,181 @@ import numpy
 .. moduleauthor:: Alex Braun <alexander.g.braun@gmail.com>
 '''
 
+# patterns are compiled once, keyed by logtype
+_TRACEBACK_RE = re.compile('Traceback.*')
+_ERROR_RE = {
+	'python': re.compile('[A-Z].*Error: .*'),
+	'mental ray': re.compile('// Error: .*')
+}
+_WARNING_RE = {
+	'python': re.compile('.*: Warning: (.*)'),
+	'mental ray': re.compile('// Warning: (.*)')
+}
+_PROGRESS_RE = {
+	'python': re.compile(r'[PERCENT|Percent|percent|PROGRESS|Progress|progress]?\d+\.?\d*[.;]?'),
+	'alfred': re.compile(r'.*ALF_PROGRESS\D*(\d+)')
+}
+_TRACEBACK_LINE_RE = re.compile(r'.*, line (\d+),')
+_TRACEBACK_FILE_RE = re.compile('File "(.*)"')
+
+# literal substrings without which a pattern cannot match
+_ERROR_LITERALS = {'python': 'Error: ', 'mental ray': '// Error: '}
+_WARNING_LITERALS = {'python': ': Warning: ', 'mental ray': '// Warning: '}
+_PROGRESS_LITERALS = {'python': None, 'alfred': 'ALF_PROGRESS'}
+
+def _get_pattern(patterns, logtype, default='python'):
+	return patterns.get(logtype, patterns[default])
+
+def get_literals(warning='mental ray', error='python', traceback=False):
+	'''
+	Literal substrings, one of which is contained by every warning or error line
+
+	Args:
+		warning (str, optional): Logtype of warnings. Default: 'mental ray'
+		error (str, optional): Logtype of errors. Default: 'python'
+		traceback (bool, optional): Include traceback lines. Default: False
+
+	Returns:
+		list of strings
+	'''
+	output = [_get_pattern(_WARNING_LITERALS, warning), _get_pattern(_ERROR_LITERALS, error)]
+	if traceback:
+		output.append('Traceback')
+	return output
+
 def get_tracebacks(item):
-	tb_err = re.compile('Traceback.*')
-	found = tb_err.match(item)
+	found = _TRACEBACK_RE.match(item)
 	if found:
 		return found.group(0)
 	else:
 		return numpy.nan
 
 def get_errors(item, logtype='python'):
-	err_re = re.compile('[A-Z].*Error: .*')
-	if logtype == 'mental ray':
-		err_re = re.compile('// Error: .*')
-	found = err_re.match(item)
+	found = _get_pattern(_ERROR_RE, logtype).match(item)
 	if found:
 		return found.group(0)
 	else:
 		return numpy.nan
 
 def get_warnings(item, logtype='python'):
-	warn_re = re.compile('.*: Warning: (.*)')
-	if logtype == 'mental ray':
-		warn_re = re.compile('// Warning: (.*)')
-	found = warn_re.search(item)
+	found = _get_pattern(_WARNING_RE, logtype).search(item)
 	if found:
 		return found.group(1)
 	else:
 		return numpy.nan
 
 def get_progress(item, logtype='python'):
-	prog_re = re.compile('[PERCENT|Percent|percent|PROGRESS|Progress|progress]?\d+\.?\d*[.;]?')
-	if logtype == 'alfred':
-		prog_re = re.compile('.*ALF_PROGRESS\D*(\d+)')
-	found = prog_re.search(item)
+	found = _get_pattern(_PROGRESS_RE, logtype).search(item)
 	if found:
 		return found.group(1)
 	else:
 		return numpy.nan
 
 def get_traceback_line(item):
-	line_re = re.compile('.*, line (\d+),')
-	found = line_re.search(item)
+	found = _TRACEBACK_LINE_RE.search(item)
 	if found:
 		return int(found.group(1))
 	else:
 		return numpy.nan
 
 def get_traceback_file(item):
-	file_re = re.compile('File "(.*)"')
-	found = file_re.search(item)
+	found = _TRACEBACK_FILE_RE.search(item)
 	if found:
 		return found.group(1)
 	else:
 		return numpy.nan
 # ------------------------------------------------------------------------------
 
+def _identity(item):
+	return item
+
+def classify_lines(lines, warning='mental ray', error='python', progress='alfred', index=None):
+	'''
+	Extract the warning, error, progress and traceback data of log lines in a single pass
+
+	Equivalent to applying each get_ function to every line.  A pattern is
+	only run against lines containing its literal substring (ie Error,
+	Warning, ALF_PROGRESS, Traceback), so most lines never reach the regex
+	engine.
+
+	Args:
+		lines (list): Log lines.
+		warning (str, optional): Logtype of warnings. Default: 'mental ray'
+		error (str, optional): Logtype of errors. Default: 'python'
+		progress (str, optional): Logtype of progress. Default: 'alfred'
+		index (list, optional): Index of returned DataFrame. Default: None
+
+	Returns:
+		DataFrame of warning, error, progress, traceback, traceback_line and
+		traceback_file columns
+	'''
+	# (column, literal, regex method, group, cast)
+	extractors = [
+		('warning', _get_pattern(_WARNING_LITERALS, warning),
+			_get_pattern(_WARNING_RE, warning).search, 1, _identity),
+		('error', _get_pattern(_ERROR_LITERALS, error),
+			_get_pattern(_ERROR_RE, error).match, 0, _identity),
+		('progress', _get_pattern(_PROGRESS_LITERALS, progress),
+			_get_pattern(_PROGRESS_RE, progress).search, 1, _identity),
+		('traceback', 'Traceback', _TRACEBACK_RE.match, 0, _identity),
+		('traceback_line', ', line ', _TRACEBACK_LINE_RE.search, 1, int),
+		('traceback_file', 'File "', _TRACEBACK_FILE_RE.search, 1, _identity)
+	]
+
+	columns = [[] for x in extractors]
+	nan = numpy.nan
+	for line in lines:
+		for column, (name, literal, method, group, cast) in zip(columns, extractors):
+			found = None
+			if literal is None or literal in line:
+				found = method(line)
+			if found:
+				column.append(cast(found.group(group)))
+			else:
+				column.append(nan)
+
+	data = OrderedDict((x[0], col) for x, col in zip(extractors, columns))
+	return DataFrame(data, index=index)
+# ------------------------------------------------------------------------------
+
+class LineReference(object):
+	'''
+	Lazy reference to a line of a file, by byte offset and length
+
+	The line is only read and decoded when its text is requested, such as
+	when it is printed.
+	'''
+	__slots__ = ['filepath', 'offset', 'length']
+
+	def __init__(self, filepath, offset, length):
+		self.filepath = filepath
+		self.offset = offset
+		self.length = length
+
+	@property
+	def text(self):
+		with open(self.filepath, 'rb') as f:
+			f.seek(self.offset)
+			return f.read(self.length).decode('utf-8', 'replace')
+
+	def __str__(self):
+		return self.text
+
+	def __repr__(self):
+		return 'LineReference({!r}, {}, {})'.format(self.filepath, self.offset, self.length)
+
+	def __eq__(self, other):
+		if not isinstance(other, LineReference):
+			return False
+		return (self.filepath, self.offset, self.length) == (other.filepath, other.offset, other.length)
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __hash__(self):
+		return hash((self.filepath, self.offset, self.length))
+# ------------------------------------------------------------------------------
+
 def main():
 	'''
 	Run help if called directly
@@ -77,7 +199,8 @@ def main():
 	help(__main__)
 
 __all__ = ['get_tracebacks', 'get_errors', 'get_warnings', 'get_progress',
-			'get_traceback_line', 'get_traceback_file']
+			'get_traceback_line', 'get_traceback_file', 'get_literals',
+			'classify_lines', 'LineReference']
 
 if __name__ == '__main__':
 	main()